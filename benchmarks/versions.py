@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''Micro-benchmark of versions.convert against distutils LooseVersion.'''
+import importlib.util
+import random
+import timeit
+import warnings
+
+from pathlib import Path, PurePath
+
+SOURCE = PurePath(Path(__file__).resolve().parent.parent, 'src/loopslib/versions.py')
+
+
+def load_versions():
+    """Load the versions module without importing the loopslib package."""
+    spec = importlib.util.spec_from_file_location('versions', SOURCE)
+    result = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(result)
+
+    return result
+
+
+def sample(count=900, seed=1):
+    """Apple package style version strings, repeated as they are when comparing receipts and feeds."""
+    rand = random.Random(seed)
+    strings = ['{a}.{b}.{c}'.format(a=rand.randint(1, 10), b=rand.randint(0, 9), c=rand.randint(0, 99)) for _ in range(count)]
+    result = [(_v, rand.choice(strings)) for _v in strings * 4]
+
+    return result
+
+
+def main():
+    """main"""
+    versions = load_versions()
+    pairs = sample()
+
+    # distutils is deprecated (and removed in Python 3.12), which is why it is being replaced
+    warnings.simplefilter('ignore', DeprecationWarning)
+
+    try:
+        from distutils.version import LooseVersion
+    except ImportError:
+        LooseVersion = None
+
+    def current():
+        for _a, _b in pairs:
+            versions.convert(_a) > versions.convert(_b)
+
+    print('versions.convert: {t:.4f}s for {n} comparisons'.format(t=min(timeit.repeat(current, number=10, repeat=5)) / 10, n=len(pairs)))
+
+    if LooseVersion:
+        def loose():
+            for _a, _b in pairs:
+                LooseVersion(_a) > LooseVersion(_b)
+
+        mismatched = [(_a, _b) for _a, _b in pairs if (LooseVersion(_a) > LooseVersion(_b)) != (versions.convert(_a) > versions.convert(_b))]
+        print('LooseVersion:     {t:.4f}s for {n} comparisons'.format(t=min(timeit.repeat(loose, number=10, repeat=5)) / 10, n=len(pairs)))
+        print('Ordering mismatches: {count}'.format(count=len(mismatched)))
+    else:
+        print('distutils is not available, skipping LooseVersion comparison')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 '''Build distributable and package.'''
 import argparse
+import gzip
+import os
+import plistlib
 import re
 import subprocess
 import sys
@@ -8,10 +11,14 @@ import zipapp
 
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path, PurePath
 
 CONF = PurePath(Path.cwd(), 'src/loopslib/resources/configuration.yaml')
+RESOURCES = PurePath(Path.cwd(), 'src/loopslib/resources')
+SNAPSHOT_HEADERS = ['content-length', 'accept-ranges', 'cdnuuid', 'content-encoding', 'etag', 'last-modified']
+SNAPSHOT_WORKERS = 16
 
 
 def arguments():
@@ -62,6 +69,12 @@ def arguments():
                         help='check for new source content property lists',
                         required=False)
 
+    parser.add_argument('--snapshot',
+                        dest='snapshot',
+                        action='store_true',
+                        help='snapshot the supported source content property lists for offline dry runs (also done with --check-updates)',
+                        required=False)
+
     parser.add_argument('--update-version',
                         dest='update_version',
                         action='store_true',
@@ -160,6 +173,77 @@ def status(u):
     return result
 
 
+def probe(u):
+    """Status, final URL and headers of an HTTP/HTTPS resource, returns a dictionary"""
+    cmd = ['curl', '-I', '-L', '--silent', '-w', '\n%{http_code}\n%{url_effective}', '--user-agent', 'appleloops-snapshot', u]
+    _p = subprocess.run(cmd, capture_output=True, encoding='utf-8')
+    lines = _p.stdout.strip().splitlines()
+    _status, _url = lines[-2:] if len(lines) >= 2 else ('0', u)
+    blocks = [_b for _b in '\n'.join(lines[:-2]).split('\n\n') if _b.strip()]
+    headers = dict()
+
+    # Only the headers of the last response in the redirect chain are kept
+    for line in (blocks[-1].splitlines() if _p.returncode == 0 and blocks else list()):
+        if ':' in line:
+            _k, _v = [_x.strip() for _x in line.split(':', 1)]
+
+            if _k.lower() in SNAPSHOT_HEADERS:
+                headers[_k.lower()] = int(_v) if _k.lower() == 'content-length' and _v.isdigit() else _v
+
+    result = {'status': int(_status) if _status.isdigit() else 0, 'url': _url or u, 'headers': headers}
+
+    return result
+
+
+def fetch_plist(u):
+    """Fetch and read a property list, returns a dictionary or None"""
+    result = None
+    cmd = ['curl', '-L', '--silent', '--fail', '--compressed', '--user-agent', 'appleloops-snapshot', u]
+    _p = subprocess.run(cmd, capture_output=True)
+
+    if _p.returncode == 0:
+        try:
+            result = plistlib.loads(_p.stdout)
+        except (plistlib.InvalidFileException, ValueError) as e:
+            print('Unable to read {url}: {error}'.format(url=u, error=e))
+
+    return result
+
+
+def snapshot(config, feed_url):
+    """Snapshot the packages of each supported source with the status, size and headers of each package. Returns the file path."""
+    result = Path(PurePath(RESOURCES, config['SNAPSHOT']['file']))
+    tmp = result.with_name('{name}.tmp'.format(name=result.name))
+    feeds, urls = dict(), set()
+
+    for app, sources in sorted(config['AUDIOCONTENT']['supported'].items()):
+        for _, source in sorted(sources.items()):
+            url = '{feedurl}/{sourcefile}'.format(feedurl=feed_url, sourcefile=source)
+            packages = (fetch_plist(url) or dict()).get('Packages', None)
+
+            print('Snapshot {url} ({count} packages)'.format(url=url, count=len(packages or dict())))
+
+            if packages:
+                feeds[url] = packages
+                # Same URL as 'LoopPackage.parse_url' creates for Apple's servers
+                urls.update({re.sub(r'lp10_ms3_content_2016/../lp10_ms3_content_2013', 'lp10_ms3_content_2013',
+                                    '{feedurl}/{pkgname}'.format(feedurl=feed_url, pkgname=_attrs['DownloadName']))
+                             for _, _attrs in packages.items() if _attrs.get('DownloadName')})
+
+    with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as executor:
+        probes = dict(zip(sorted(urls), executor.map(probe, sorted(urls))))
+
+    data = {'created': datetime.now(), 'feed_url': feed_url, 'feeds': feeds, 'probes': probes}
+
+    with open(tmp, 'wb') as _f:
+        _f.write(gzip.compress(plistlib.dumps(data, fmt=plistlib.FMT_BINARY, sort_keys=True)))
+
+    os.replace(tmp, result)
+    print('Snapshot of {feeds} sources and {probes} packages written to {f}'.format(feeds=len(feeds), probes=len(probes), f=result))
+
+    return result
+
+
 def update_supported_sources(config, http_ok, feed_url):
     """Update the supported source files. Returns a tuple indicating version/build update required, and a modified config."""
     result = (False, config)  # Tuple, ('update_version', 'config')
@@ -229,6 +313,10 @@ def main():
     if args.check_updates:
         update_ver, config = update_supported_sources(config=config, http_ok=http_ok, feed_url=feed_url)
 
+    # Snapshot the (updated) supported sources so dry runs and comparisons don't need network access
+    if args.check_updates or args.snapshot:
+        snapshot(config=config, feed_url=feed_url)
+
     # Update the version/build if required.
     if update_ver:
         update_version(config=config)
@@ -11,6 +11,9 @@ LOG = logging.getLogger(__name__)
 
 
 try:
+    if ARGS.serve:
+        process.serve_mirror()
+
     if ARGS.compare:
         process.compare_sources()
 
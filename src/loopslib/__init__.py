@@ -40,6 +40,9 @@ BUILD = CONF['MODULE']['build_date']
 VERSION_STRING = '{name} {version} ({build}) {eula}'.format(name=NAME, version=VERSION, build=BUILD, eula=LICENSE)
 USER_AGENT = '{name}/{version}'.format(name=NAME, version=VERSION)
 HTTP_OK = CONF['CURL']['http_ok_status']
+PROBE_CONCURRENCY = CONF['PROBE']['concurrency']
+PROBE_HOST_LIMIT = CONF['PROBE']['host_limit']
+PROBE_TIMEOUT = CONF['PROBE']['timeout']
 PACKAGE_CHOICES = CONF['AUDIOCONTENT']['supported']
 BASE_URL = CONF['AUDIOCONTENT']['base_url']
 FEED_URL = CONF['AUDIOCONTENT']['feed_url']
@@ -48,14 +51,26 @@ APPLICATION_FOLDER = CONF['APPLICATIONS']['app_folder']
 APPLICATIONS = CONF['APPLICATIONS']['supported']
 TEMPDIR = Path(tempfile.gettempdir()) / BUNDLE_ID
 DMG_MOUNT = CONF['DMG']['mountpoint']
+DOWNLOAD_HOST_LIMIT = CONF['DOWNLOAD']['host_limit']
 DMG_VOLUME_NAME = CONF['DMG']['volume_name']
 VALID_DMG_FS = CONF['DMG']['valid_fs']
 DMG_DEFAULT_FS = CONF['DMG']['default_fs']
 RUN_UUID = str(uuid4()).upper()
 INSTALL_TARGET = Path(CONF['INSTALL']['target'])
+RECEIPTS_DIR = Path(CONF['INSTALL']['receipts'])
 FAIL_LOG = 'appleloops_failed_installs.log'
 SYSTEM_UPDATER = Path('/{pref}'.format(pref=CONF['UPDATER']['pref']))
 USER_UPDATER = Path('~/{pref}'.format(pref=CONF['UPDATER']['pref'])).expanduser()
+SUPPORT_DIR = SYSTEM_UPDATER.parent if osinfo.isroot() else USER_UPDATER.parent
+METADATA_CACHE = SUPPORT_DIR / CONF['METADATA']['file']
+METADATA_MAX_ENTRIES = CONF['METADATA']['max_entries']
+METADATA_TTL = CONF['METADATA']['ttl']
+DOWNLOAD_JOURNAL = SUPPORT_DIR / CONF['DOWNLOAD']['journal']
+FEED_CACHE = SUPPORT_DIR / CONF['FEEDS']['cache']
+FEED_INDEX = FEED_CACHE / CONF['FEEDS']['index']
+FEED_INDEX_TTL = CONF['FEEDS']['index_ttl']
+MIRROR_MANIFEST = CONF['MIRROR']['manifest']
+SNAPSHOT_FILE = CONF['SNAPSHOT']['file']
 
 # Have to do other non-core module loading here to avoid circular imports
 from . import arguments  # NOQA
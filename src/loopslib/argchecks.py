@@ -30,6 +30,14 @@ def check(args, helper, choices):
     latest_plists = ['{choice}.plist'.format(choice=c) for _, c in choices['latest'].items() if c != 'all']
     update_latest_plists = {_k: _v for _k, _v in choices['latest'].items() if _k != 'all'}
 
+    # Select the HTTP transport before any requests are made, the native client only speaks HTTP/1.1
+    if args.http2 and args.http_backend == 'native':
+        LOG.debug('--http2: using cURL backend')
+        args.http_backend = 'curl'
+
+    curl.configure(backend=args.http_backend, insecure=args.insecure, segments=args.segments,
+                   segment_threshold=args.segment_threshold * 1024 * 1024, algorithm=args.hash_algorithm)
+
     # Deployment - must be root
     if args.deployment:
         if not osinfo.isroot() and not args.dry_run:
@@ -40,14 +48,53 @@ def check(args, helper, choices):
         if not args.apps:
             args.apps = [c for c in choices['supported'] if c != 'all']
 
+    # Serving a mirror doesn't process packages
+    if args.serve:
+        args.serve = Path(args.serve)
+
+        if not args.serve.is_dir():
+            error(msg='--serve: folder does not exist', fatal=True, helper=helper, returncode=44)
+
+    # Must serve on a valid port
+    if not 0 < args.serve_port < 65536:
+        error(msg='--serve-port: must be between 1 and 65535', fatal=True, helper=helper, returncode=43)
+
     # Must provide 'mandatory' or 'optional' package set
-    if not (args.mandatory or args.optional) and not args.packages:
+    if not (args.mandatory or args.optional) and not args.packages and not args.serve:
         error(msg='-m/--mandatory or -o/--optional or both are required', fatal=True, helper=helper, returncode=60)
 
     # APFS DMG requires build
     if args.apfs_dmg and not args.build_dmg:
         error(msg='--APFS: not allowed without argument -b/--build-dmg', fatal=True, helper=helper, returncode=59)
 
+    # Must probe with at least one worker
+    if args.probe_workers < 1:
+        error(msg='--probe-workers: must be 1 or more', fatal=True, helper=helper, returncode=50)
+
+    # Must download with at least one job
+    if args.jobs < 1:
+        error(msg='-j/--jobs: must be 1 or more', fatal=True, helper=helper, returncode=49)
+
+    # Must be able to stage at least one package
+    if args.stage_budget < 1:
+        error(msg='--stage-budget: must be 1 or more', fatal=True, helper=helper, returncode=48)
+
+    # Must download in at least one segment
+    if args.segments < 1:
+        error(msg='--segments: must be 1 or more', fatal=True, helper=helper, returncode=47)
+
+    # Must have a size threshold to fetch in byte ranges
+    if args.segment_threshold < 1:
+        error(msg='--segment-threshold: must be 1 or more', fatal=True, helper=helper, returncode=42)
+
+    # Sync compares packages in a download destination
+    if args.sync and args.deployment:
+        error(msg='--sync: not allowed with argument --deployment', fatal=True, helper=helper, returncode=46)
+
+    # Delta downloads packages into a download destination
+    if args.delta and args.deployment:
+        error(msg='--delta: not allowed with argument --deployment', fatal=True, helper=helper, returncode=45)
+
     # Valid Caching Server URL
     if args.cache_server:
         url = urlparse(args.cache_server)
@@ -1,9 +1,17 @@
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePath
 from pprint import pformat
+from urllib.parse import urlparse
 
+from . import curl
+from . import journal
+from . import manifest
+from . import metadata
 from . import package
+from . import pkgutil
+from . import probes
 from . import resource
 from . import ARGS
 from . import PACKAGE_CHOICES
@@ -18,6 +26,14 @@ def read():
     return result
 
 
+def create(attrs):
+    """Create a package instance and resolve the attributes this run reads."""
+    result = package.LoopPackage(**attrs)
+    result.prefetch()
+
+    return result
+
+
 def patch(packages, source, comparing=False):
     """Patch the set of packages with any updates"""
     result = set()
@@ -55,7 +71,11 @@ def patch(packages, source, comparing=False):
     total, counter = len([_p for _p in _packages]), 1
     LOG.info('Processing {source}'.format(source=source))
 
-    # Iterate and patch
+    # Iterate and patch, resolving which packages need instances in feed order so
+    # the 'LoopPackage.INSTANCES' dedupe is deterministic regardless of probe order.
+    pending = list()
+    claimed = set()
+
     for _pkg, _attrs in _packages.items():
         patch = dict()
         ignore = False
@@ -81,27 +101,57 @@ def patch(packages, source, comparing=False):
 
         # If comparing sources, create an instance of package.LoopPackage regardless
         if comparing:
-            pkg = package.LoopPackage(**new_attrs)
-            LOG.debug('{attrs}'.format(attrs=pkg.__dict__))
-            result.add(pkg)
+            pending.append((_pkg, new_attrs, ignore))
         else:
-            if package_id not in package.LoopPackage.INSTANCES:
-                pkg = package.LoopPackage(**new_attrs)
-                LOG.debug('{attrs}'.format(attrs=pkg.__dict__))
-
-                if not ignore:
-                    result.add(pkg)
-                    LOG.debug('Added {pkg}'.format(pkg=_pkg))
-                else:
-                    LOG.debug('Skipped adding {pkg} as it has been patched to be ignored.'.format(pkg=_pkg))
-            elif package_id in package.LoopPackage.INSTANCES:
+            if package_id not in package.LoopPackage.INSTANCES and package_id not in claimed:
+                claimed.add(package_id)
+                pending.append((_pkg, new_attrs, ignore))
+            else:
                 LOG.debug('Already processed {pkg}'.format(pkg=_pkg))
 
-        _msg = 'Processed ({count} of {total}) - {pkgid}'.format(pkgid=package_id, count=padded_count, total=total)
         counter += 1
 
+    # Probe the package URLs concurrently ahead of creating instances, results are shared with 'curl.probe'.
+    # URLs with persistently cached metadata or a completed download at their destination in this run (unless
+    # syncing) are not probed again, the same check 'LoopPackage.parse_headers' makes.
+    urls = [package.LoopPackage.parse_url(_attrs.get('DownloadName', None)) for _, _attrs, _ in pending]
+
+    if not (ARGS.force or ARGS.sync):
+        urls = [_u for _u in urls if not (urlparse(_u).scheme and journal.JOURNAL.completed(package.LoopPackage.parse_dest(_u)))]
+
+    metadata.prime(urls)
+
+    # Packages in the manifest of a package server mirror are known without probing them
+    urls = manifest.prime(urls)
+
+    if ARGS.probe_engine == 'asyncio' and curl.BACKEND == 'native':
+        probes.run(urls, insecure=ARGS.insecure)
+
+    # List the directories holding FileCheck paths once, grouped by directory, for installed checks
+    if ARGS.deployment and not comparing:
+        file_checks = [_attrs.get('FileCheck', None) for _, _attrs, _ in pending]
+        pkgutil.prime_files([_f for _fc in file_checks if _fc for _f in ([_fc] if isinstance(_fc, str) else _fc)])
+
+    # Create the instances through a bounded pool, 'map' returns them in submission order
+    with ThreadPoolExecutor(max_workers=ARGS.probe_workers) as executor:
+        instances = list(executor.map(lambda _p: create(_p[1]), pending))
+
+    total = len(pending)
+
+    for counter, ((_pkg, _, ignore), pkg) in enumerate(zip(pending, instances), start=1):
+        padded_count = '{i:0{width}d}'.format(width=len(str(total)), i=counter)
+        LOG.debug('{attrs}'.format(attrs=pkg.as_dict()))
+
+        if comparing or not ignore:
+            result.add(pkg)
+            LOG.debug('Added {pkg}'.format(pkg=_pkg))
+        else:
+            LOG.debug('Skipped adding {pkg} as it has been patched to be ignored.'.format(pkg=_pkg))
+
+        _msg = 'Processed ({count} of {total}) - {pkgid}'.format(pkgid=pkg.package_id, count=padded_count, total=total)
+
         # Add an extra line in the debug output for readability
-        if counter - 1 != total:
+        if counter != total:
             _msg = '{msg}\n'.format(msg=_msg)
 
         LOG.debug(_msg)
@@ -5,6 +5,8 @@ import sys
 from pathlib import Path
 
 from . import disk
+from . import index
+from . import metadata
 from . import source
 from . import ARGS
 
@@ -19,8 +21,11 @@ def sources(plist_a, plist_b, style=ARGS.compare_style):
         LOG.info('Invalid diff style selected. Choose from {styles}'.format(styles=styles))
         sys.exit(88)
 
-    packages_a = source.PropertyList(plist=plist_a, comparing=True).packages
-    packages_b = source.PropertyList(plist=plist_b, comparing=True).packages
+    packages_a, packages_b = [p.packages for p in source.property_lists([plist_a, plist_b], comparing=True)]
+
+    # Persist any package metadata probed while creating packages, and any feeds indexed
+    metadata.save()
+    index.save()
 
     if packages_a:
         _unsequenced_a = sorted([pkg for pkg in packages_a if not pkg.sequence_number], key=lambda pkg: pkg.download_name)
@@ -1,42 +1,146 @@
 import logging
+import os
 import subprocess
 
+from collections import namedtuple
 from pathlib import Path
 from pathlib import PurePath
+from threading import Lock
 
+from . import hashing
+from . import httpclient
+from . import journal
 from . import USER_AGENT
 
 LOG = logging.getLogger(__name__)
+BACKEND = 'native'  # Either 'native' or 'curl', set with 'configure'
+INSECURE = False
+SEGMENTS = 1  # Byte ranges fetched concurrently for large resources, set with 'configure'
+SEGMENT_THRESHOLD = 0
+HASH_ALGORITHM = 'sha256'  # Packages are hashed with this algorithm as they are downloaded, set with 'configure'
 
+# Probes are shared by everything that needs facts about a URL in a run
+Probe = namedtuple('Probe', ['status', 'content_length', 'accept_ranges', 'cdn_uuid', 'content_encoding', 'url', 'headers'])
+_PROBES = dict()
+_PROBES_LOCK = Lock()
 
-def headers(u):
-    """Headers of an HTTP/HTTPS resource"""
+
+def configure(backend=None, insecure=None, segments=None, segment_threshold=None, algorithm=None):
+    """Select the HTTP transport used for probing and fetching resources, settings that aren't given are left unchanged"""
+    global BACKEND, INSECURE, SEGMENTS, SEGMENT_THRESHOLD, HASH_ALGORITHM
+
+    BACKEND = backend if backend is not None else BACKEND
+    INSECURE = insecure if insecure is not None else INSECURE
+    SEGMENTS = segments if segments is not None else SEGMENTS
+    SEGMENT_THRESHOLD = segment_threshold if segment_threshold is not None else SEGMENT_THRESHOLD
+    HASH_ALGORITHM = algorithm if algorithm is not None else HASH_ALGORITHM
+    LOG.debug('Using {backend} HTTP backend, hashing with {algorithm}'.format(backend=BACKEND, algorithm=HASH_ALGORITHM))
+
+
+def parse_headers(lines):
+    """Parse header lines into a dictionary with lower case keys"""
     result = dict()
-    cmd = ['/usr/bin/curl', '-I', '-L', '--user-agent', USER_AGENT, u]
-    _p = subprocess.run(cmd, capture_output=True, encoding='utf-8')
+
+    for _l in lines:
+        _l = _l.strip()
+
+        if ': ' in _l:
+            _k, _v = _l.split(': ', 1)
+
+            if _v and all([_c.isdigit() for _c in _v]):
+                _v = int(_v)
+            else:
+                _v = _v.strip()
+
+            result[_k.lower().strip()] = _v
+
+    return result
+
+
+def probe(u, validators=None):
+    """Probe an HTTP/HTTPS resource once per run, returns a Probe namedtuple. Probing with validators ('etag', 'last-modified')
+    is conditional, the status is 304 if the resource hasn't changed and the result isn't kept for the run"""
+    result = None
+    validators = validators or dict()
+    conditions = dict()
 
     # Convert URL from path object to string if path
     if isinstance(u, (Path, PurePath)):
         u = str(u)
 
-    if _p.returncode == 0:
+    result = cached(u) if not validators else None
+
+    if result:
+        return result
+
+    if validators.get('etag'):
+        conditions['If-None-Match'] = validators['etag']
+
+    if validators.get('last-modified'):
+        conditions['If-Modified-Since'] = validators['last-modified']
+
+    if BACKEND == 'native':
+        _response = httpclient.head(u, headers=conditions, insecure=INSECURE)
+        _status, _url = str(_response.status), _response.url
+        _headers = parse_headers(['{k}: {v}'.format(k=_k, v=_v) for _k, _v in _response.headers])
+    else:
+        # The write out is appended after the headers of every response in the redirect chain
+        cmd = ['/usr/bin/curl', '-I', '-L', '--silent', '-w', '\n%{http_code}\n%{url_effective}', '--user-agent', USER_AGENT, u]
+
+        for _k, _v in conditions.items():
+            cmd.extend(['-H', '{k}: {v}'.format(k=_k, v=_v)])
+
+        if INSECURE:
+            cmd.append('--insecure')
+
+        _p = subprocess.run(cmd, capture_output=True, encoding='utf-8')
         _lines = _p.stdout.strip().splitlines()
+        _status, _url = _lines[-2:] if len(_lines) >= 2 else ('0', u)
+        _blocks = [_b for _b in '\n'.join(_lines[:-2]).split('\n\n') if _b.strip()]
+        _headers = parse_headers(_blocks[-1].splitlines()) if _p.returncode == 0 and _blocks else dict()
+
+        LOG.debug('{cmd} [exit code {returncode}]'.format(cmd=' '.join(cmd), returncode=_p.returncode))
 
-        for _l in _lines:
-            _l = _l.strip()
+    result = to_probe(status=_status, headers=_headers, url=_url or u)
 
-            if ': ' in _l:
-                _k, _v = _l.split(': ')
+    LOG.debug('{url} ({http_status}) {headers}'.format(url=u, http_status=result.status, headers=_headers))
 
-                if all([_c.isdigit() for _c in _v]):
-                    _v = int(_v)
-                else:
-                    _v = _v.strip()
+    if result.status != 304:
+        prime(u, result)
+
+    return result
 
-                result[_k.lower().strip()] = _v
 
-    LOG.debug('{cmd} [exit code {returncode}]'.format(cmd=' '.join(cmd), returncode=_p.returncode))
-    LOG.debug(result)
+def to_probe(status, headers, url):
+    """Create a Probe from a status and a dictionary of parsed headers"""
+    result = Probe(status=int(status) if str(status).isdigit() else 0,
+                   content_length=headers.get('content-length', 0),
+                   accept_ranges=headers.get('accept-ranges', False) == 'bytes',
+                   cdn_uuid=headers.get('cdnuuid', None),
+                   content_encoding=headers.get('content-encoding', None),
+                   url=url,
+                   headers=headers)
+
+    return result
+
+
+def cached(u):
+    """Return the Probe for a URL if it has already been probed this run"""
+    with _PROBES_LOCK:
+        result = _PROBES.get(str(u), None)
+
+    return result
+
+
+def prime(u, result):
+    """Store a Probe for a URL so later probes of the same URL are free"""
+    with _PROBES_LOCK:
+        _PROBES[str(u)] = result
+
+
+def headers(u):
+    """Headers of an HTTP/HTTPS resource"""
+    result = probe(u).headers
 
     return result
 
@@ -44,32 +148,107 @@ def headers(u):
 def is_compressed(u):
     """Return boolean if HTTP/HTTPS resource is compressed"""
     # NOTE: At present (2021-06-15), the only encoding seen is 'gzip' type, but that may change
-    # Convert URL from path object to string if path
-    result = None
-
-    if isinstance(u, (Path, PurePath)):
-        u = str(u)
-
-    result = headers(u).get('content-encoding') == 'gzip'
+    result = probe(u).content_encoding == 'gzip'
 
     return result
 
 
 def status(u):
     """Status code of an HTTP/HTTPS resource"""
-    result = None
+    result = probe(u).status
 
-    # Convert URL from path object to string if path
-    if isinstance(u, (Path, PurePath)):
-        u = str(u)
+    return result
+
+
+def is_segmentable(u, dest, resume):
+    """Resource is large enough to fetch in byte ranges (at least one byte per range), and a fresh download that can be resumed"""
+    _probe = probe(u)
+    result = (SEGMENTS > 1 and resume and _probe.accept_ranges and not _probe.content_encoding
+              and _probe.content_length >= max(SEGMENT_THRESHOLD, SEGMENTS) and not Path(dest).exists())
+
+    return result
 
-    cmd = ['/usr/bin/curl', '-I', '-L', '--silent', '-o', '/dev/null', '-w', '"%{http_code}"', '--user-agent', USER_AGENT, u]
-    _p = subprocess.run(cmd, capture_output=True, encoding='utf-8')
-    result = int(_p.stdout.strip().replace('"', ''))
 
-    LOG.debug('{cmd} ({http_status}) [exit code {returncode}]'.format(cmd=' '.join(cmd),
-                                                                      http_status=result,
-                                                                      returncode=_p.returncode))
+def transfer(u, dest, quiet=False, resume=False, http2=False, insecure=False, compressed=False, segmented=False, digest=None):
+    """Transfer an HTTP/HTTPS resource to a local destination, hashing the bytes written into digest, returns boolean if the transfer succeeded"""
+    result = False
+
+    # The native client only speaks HTTP/1.1, so HTTP2 always uses cURL
+    if BACKEND == 'native' and not http2:
+        status = 0
+
+        if segmented:
+            status = httpclient.get_segmented(u, dest, size=probe(u).content_length, segments=SEGMENTS, insecure=insecure)
+
+        # Fall back to a single stream if the segmented download wasn't possible or failed
+        if not status:
+            status = httpclient.get(u, dest, quiet=quiet, resume=resume, compressed=compressed, insecure=insecure, digest=digest)
+
+        result = status in [200, 206, 416]
+    else:
+        # When hashing, cURL writes to stdout so the bytes can be hashed on their way to the destination
+        offset = Path(dest).stat().st_size if digest and resume and Path(dest).exists() else 0
+
+        # Build the command
+        cmd = ['/usr/bin/curl', '-L', '--user-agent', USER_AGENT, u]
+
+        if not digest:
+            cmd.extend(['--create-dirs', '-o', dest])
+
+        if quiet:
+            cmd.append('--silent')
+        else:
+            cmd.append('--progress-bar')
+
+        if resume:
+            cmd.append('-C')
+            cmd.append(str(offset) if digest else '-')
+
+        if compressed:
+            LOG.debug('Compressed resource found, updating cURL command')
+            cmd.append('--compressed')
+
+        # HTTP2
+        if http2:
+            cmd.append('--http2')
+        else:
+            cmd.append('--http1.1')
+
+        # Insecure TLS - not recommended
+        if insecure:
+            cmd.append('--insecure')
+
+        # Don't write out error pages when downloading to a partial file that is renamed once complete
+        if dest.endswith('.part'):
+            cmd.append('--fail')
+
+        if digest:
+            Path(dest).parent.mkdir(parents=True, exist_ok=True)
+
+            # The bytes already on disk are part of the hash when resuming
+            if offset:
+                hashing.read(dest, digest, length=offset)
+
+            with open(dest, 'ab' if offset else 'wb') as _f:
+                _p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+                for chunk in iter(lambda: _p.stdout.read(hashing.CHUNK_SIZE), b''):
+                    if httpclient.STOP.is_set():
+                        _p.terminate()
+                        break
+
+                    _f.write(chunk)
+                    digest.update(chunk)
+
+                _p.wait()
+        else:
+            # Even though assigned, the progress bar will still output to stdout.
+            _p = subprocess.run(cmd)
+
+        result = _p.returncode == 0
+
+        # Log curl command before reverting dest to path object
+        LOG.debug('{cmd} [exit code {returncode}]'.format(cmd=' '.join(cmd), returncode=_p.returncode))
 
     return result
 
@@ -86,43 +265,18 @@ def get(u, dest, quiet=False, resume=False, http2=False, insecure=False, dry_run
     if isinstance(u, (Path, PurePath)):
         u = str(u)
 
-    # Build the command
-    cmd = ['/usr/bin/curl', '-L', '--user-agent', USER_AGENT, u, '--create-dirs', '-o', dest]
-
-    if quiet:
-        cmd.append('--silent')
-    else:
-        cmd.append('--progress-bar')
-
     # NOTE: Resume really only works for packages and may not actually work as expected
     # if the server doesn't support resume.
     # For example, the Apple audiocontent servers don't seem to properly support resume
     # for the plist files they host, but do for the package files.
-    if resume and '.pkg' in u:
-        cmd.append('-C')
-        cmd.append('-')
-
-    # Check for compression on the fly and add in the relevant flag to handle it
-    if is_compressed(u):
-        LOG.debug('Compressed resource found, updating cURL command')
-        cmd.append('--compressed')
-
-    # HTTP2
-    if http2:
-        cmd.append('--http2')
-    else:
-        cmd.append('--http1.1')
-
-    # Insecure TLS - not recommended
-    if insecure:
-        cmd.append('--insecure')
+    resume = resume and '.pkg' in u
 
     if not dry_run:
-        # Even though assigned, the progress bar will still output to stdout.
-        _p = subprocess.run(cmd)
-
-    # Log curl command before reverting dest to path object
-    LOG.debug('{cmd} [exit code {returncode}]'.format(cmd=' '.join(cmd), returncode=_p.returncode))
+        # Packages are journaled and downloaded to a partial file that is renamed into place once complete
+        if '.pkg' in u:
+            get_journaled(u, dest, quiet=quiet, resume=resume, http2=http2, insecure=insecure)
+        else:
+            transfer(u, dest, quiet=quiet, resume=resume, http2=http2, insecure=insecure, compressed=is_compressed(u))
 
     # Reconvert the destination to a path object
     dest = Path(dest)
@@ -131,3 +285,94 @@ def get(u, dest, quiet=False, resume=False, http2=False, insecure=False, dry_run
         result = dest
 
     return result
+
+
+def get_conditional(u, validators=None, http2=False, insecure=False):
+    """Fetch HTTP/HTTPS resource into memory unless it hasn't changed since the validators ('etag', 'last-modified'),
+    returns a tuple of the HTTP status, a dictionary of parsed headers and the body, which is empty unless the status is 200"""
+    result = (0, dict(), b'')
+    validators = validators or dict()
+
+    # The native client only speaks HTTP/1.1, so HTTP2 always uses cURL
+    if BACKEND == 'native' and not http2:
+        _response, _body = httpclient.get_conditional(u, validators=validators, insecure=insecure)
+        result = (_response.status, parse_headers(['{k}: {v}'.format(k=_k, v=_v) for _k, _v in _response.headers]), _body)
+    else:
+        # The body is written to stdout and the headers of every response in the redirect chain to stderr
+        cmd = ['/usr/bin/curl', '-L', '--silent', '--compressed', '-D', '/dev/stderr', '--user-agent', USER_AGENT, u]
+
+        if validators.get('etag'):
+            cmd.extend(['-H', 'If-None-Match: {etag}'.format(etag=validators['etag'])])
+
+        if validators.get('last-modified'):
+            cmd.extend(['-H', 'If-Modified-Since: {modified}'.format(modified=validators['last-modified'])])
+
+        cmd.append('--http2' if http2 else '--http1.1')
+
+        # Insecure TLS - not recommended
+        if insecure:
+            cmd.append('--insecure')
+
+        _p = subprocess.run(cmd, capture_output=True)
+        _blocks = [_b for _b in '\n'.join(_p.stderr.decode('utf-8', 'replace').splitlines()).split('\n\n') if _b.strip()]
+        _lines = _blocks[-1].splitlines() if _p.returncode == 0 and _blocks else list()
+        _status = _lines[0].split()[1] if _lines and len(_lines[0].split()) > 1 else '0'
+        _status = int(_status) if _status.isdigit() else 0
+        result = (_status, parse_headers(_lines[1:]), _p.stdout if _status == 200 else b'')
+
+        LOG.debug('{cmd} [exit code {returncode}]'.format(cmd=' '.join(cmd), returncode=_p.returncode))
+
+    return result
+
+
+def get_journaled(u, dest, quiet=False, resume=False, http2=False, insecure=False):
+    """Fetch HTTP/HTTPS resource through the download journal, returns boolean if the destination is complete"""
+    result = False
+
+    # Completed downloads are skipped before probing the resource
+    if journal.JOURNAL.completed(dest):
+        LOG.debug('Skipping {dest}, already downloaded'.format(dest=dest))
+
+        return True
+
+    # Check for compression on the fly so either backend can handle it
+    compressed = is_compressed(u)
+
+    # The decoded length of a compressed resource isn't known up front
+    expected = probe(u).content_length if not compressed else 0
+    segmented = is_segmentable(u, journal.partial(dest), resume) and BACKEND == 'native' and not http2
+    validators = probe(u).headers
+    part = journal.JOURNAL.begin(dest, u, expected, segmented=segmented, validators=validators)
+
+    # Existing downloads are adopted by the journal if they are already complete
+    if not part:
+        return True
+
+    # A preallocated segmented file can't be told apart from a complete one by length, so record it
+    # straight away in case this run doesn't get to save the journal
+    if segmented:
+        journal.JOURNAL.save()
+
+    digest = hashing.StreamingHash(HASH_ALGORITHM)
+    transferred = transfer(u, str(part), quiet=quiet, resume=resume, http2=http2, insecure=insecure, compressed=compressed,
+                           segmented=segmented, digest=digest)
+    received = part.stat().st_size if part.exists() else 0
+
+    # A transfer can end successfully without being complete, such as a server closing the connection early
+    if part.exists() and ((expected and received == expected) or (not expected and transferred)):
+        # Segmented downloads are written out of order, so they (and anything else not hashed as it
+        # was written, such as a partial file that was already complete) are read back to be hashed
+        if digest.length != received:
+            digest = hashing.read(part, hashing.StreamingHash(HASH_ALGORITHM))
+
+        os.replace(part, dest)
+        result = True
+
+    journal.JOURNAL.finish(dest, u, expected, received=received, complete=result, segmented=segmented, validators=validators,
+                           digest=digest if result else None)
+    LOG.debug('Journaled {dest} ({received} of {expected} bytes received, complete: {complete})'.format(dest=dest,
+                                                                                                    received=received,
+                                                                                                    expected=expected,
+                                                                                                    complete=result))
+
+    return result
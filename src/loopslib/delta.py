@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import sys
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path, PurePath
+
+from . import journal
+from . import source
+from . import sync
+from . import ARGS
+from . import DMG_MOUNT
+
+LOG = logging.getLogger(__name__)
+SIZE_KEYS = ['DownloadSize', 'InstalledSize']  # First size attribute both feeds have is compared
+
+Delta = namedtuple('Delta', ['old', 'new', 'added', 'changed', 'removed', 'packages', 'plan'])
+
+
+def index(packages):
+    """Index raw feed packages by download name, returns a dictionary of download name and (key, attributes)"""
+    result = {str(PurePath(_attrs['DownloadName']).name): (_k, _attrs) for _k, _attrs in packages.items() if _attrs.get('DownloadName')}
+
+    return result
+
+
+def changes(old_attrs, new_attrs):
+    """Attributes that differ between two versions of a raw feed package, returns a list"""
+    result = list()
+
+    if str(old_attrs.get('PackageVersion', '')) != str(new_attrs.get('PackageVersion', '')):
+        result.append('PackageVersion')
+
+    for _k in SIZE_KEYS:
+        if _k in old_attrs and _k in new_attrs:
+            if old_attrs[_k] != new_attrs[_k]:
+                result.append(_k)
+
+            break
+
+    return result
+
+
+@lru_cache(maxsize=None)
+def diff(old, new):
+    """Difference between two feeds by download name, version and size, returns a Delta namedtuple"""
+    # NOTE: Cached so the delta, and the package instances created from it, are shared for the run
+    old_plist, new_plist = source.PropertyList(plist=old, parse=False), source.PropertyList(plist=new, parse=False)
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='feed') as executor:
+        old_packages, new_packages = executor.map(lambda _p: _p.load(), [old_plist, new_plist])
+
+    if not old_packages or not new_packages:
+        plists = ' and '.join([_p for _p, _pkgs in [(old, old_packages), (new, new_packages)] if not _pkgs])
+        LOG.info('Could not find packages in {plists}'.format(plists=plists))
+        sys.exit(99)
+
+    old_packages, new_packages = index(old_packages), index(new_packages)
+    added = {_n: _attrs for _n, (_, _attrs) in new_packages.items() if _n not in old_packages}
+    changed = {_n: (old_packages[_n][1], _attrs) for _n, (_, _attrs) in new_packages.items()
+               if _n in old_packages and changes(old_packages[_n][1], _attrs)}
+    removed = sorted([_n for _n in old_packages if _n not in new_packages])
+
+    # Only the new and changed packages are patched and have instances created
+    subset = {new_packages[_n][0]: new_packages[_n][1] for _n in sorted(list(added) + list(changed))}
+    packages = (new_plist.parse_plist(packages=subset) if subset else None) or set()
+    plan = {pkg: sync.CHANGED if pkg.download_name in changed else sync.NEW for pkg in packages}
+
+    # New packages that are already in the mirror, such as those shared with another feed, are skipped
+    plan.update({pkg: sync.UNCHANGED for pkg, _p in plan.items() if _p == sync.NEW and journal.JOURNAL.completed(pkg.download_dest)})
+
+    LOG.info('{new} has {added} new, {changed} changed and {removed} removed packages compared to {old}'.format(new=new,
+                                                                                                                old=old,
+                                                                                                                added=len(added),
+                                                                                                                changed=len(changed),
+                                                                                                                removed=len(removed)))
+
+    result = Delta(old=old, new=new, added=added, changed=changed, removed=removed, packages=packages, plan=plan)
+
+    return result
+
+
+def manifest(delta):
+    """Manifest of a delta, returns a dictionary"""
+    destination = Path(DMG_MOUNT if ARGS.build_dmg else ARGS.destination)
+    result = {'old': delta.old,
+              'new': delta.new,
+              'created': datetime.now().isoformat(timespec='seconds'),
+              'added': list(),
+              'changed': list(),
+              'removed': delta.removed}
+
+    for pkg in sorted(delta.packages, key=lambda _p: _p.download_name):
+        entry = {'download_name': pkg.download_name,
+                 'package_id': pkg.package_id,
+                 'version': str(pkg.version),
+                 'mandatory': pkg.mandatory,
+                 'size': pkg.download_size,
+                 'url': pkg.url,
+                 'path': os.path.relpath(pkg.download_dest, destination)}
+
+        if pkg.download_name in delta.changed:
+            old_attrs, new_attrs = delta.changed[pkg.download_name]
+            entry['previous'] = {'version': str(old_attrs.get('PackageVersion', '')),
+                                 'changes': changes(old_attrs, new_attrs)}
+            result['changed'].append(entry)
+        else:
+            result['added'].append(entry)
+
+    return result
+
+
+def write(delta):
+    """Write the delta manifest to the root of the download destination, returns the file path object"""
+    destination = Path(DMG_MOUNT if ARGS.build_dmg else ARGS.destination)
+    result = destination / 'appleloops_delta_{old}_{new}.json'.format(old=PurePath(delta.old).stem, new=PurePath(delta.new).stem)
+    tmp = result.with_name('{name}.tmp'.format(name=result.name))
+
+    destination.mkdir(parents=True, exist_ok=True)
+
+    with open(tmp, 'w') as _f:
+        json.dump(manifest(delta), _f, indent=2)
+
+    os.replace(tmp, result)
+    LOG.info('Delta manifest written to {f}'.format(f=result))
+
+    return result
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from . import curl
+from . import index
+from . import plist
+from . import ARGS
+from . import FEED_CACHE
+
+LOG = logging.getLogger(__name__)
+VALIDATORS = ['etag', 'last-modified']
+
+
+def paths(u):
+    """Cached property list and its metadata for a feed URL, returns a tuple of file path objects"""
+    url = urlparse(str(u))
+    f = Path(FEED_CACHE) / url.netloc / url.path.lstrip('/')
+    result = (f, f.with_suffix('.json'))
+
+    return result
+
+
+def load(u):
+    """Cached metadata (URL, validators and parsed 'Packages') of a feed URL, returns a dictionary or None"""
+    result = None
+    f, meta = paths(u)
+
+    try:
+        with open(meta, 'r') as _f:
+            result = json.load(_f)
+
+        # The cache is only usable for the same feed and if the property list it was parsed from is still there
+        if result.get('url') != str(u) or not f.exists():
+            result = None
+    except (OSError, ValueError, AttributeError) as e:
+        LOG.debug('No feed cache loaded for {url}: {error}'.format(url=u, error=e))
+
+    return result
+
+
+def save(u, raw, validators, packages):
+    """Save the property list of a feed URL with its validators and parsed 'Packages' alongside it, the cache is optional so failures are ignored"""
+    f, meta = paths(u)
+    data = {'url': str(u), 'validators': validators, 'packages': packages, 'updated': datetime.now().isoformat(timespec='seconds')}
+    tmp = meta.with_name('{name}.tmp'.format(name=meta.name))
+
+    try:
+        f.parent.mkdir(parents=True, exist_ok=True)
+        meta.unlink(missing_ok=True)
+
+        with open(f, 'wb') as _f:
+            _f.write(raw)
+
+        # The metadata is written last, a feed is only cached once both files are complete
+        with open(tmp, 'w') as _f:
+            json.dump(data, _f)
+
+        os.replace(tmp, meta)
+        LOG.debug('Saved feed cache for {url}'.format(url=u))
+    except (OSError, TypeError, ValueError) as e:
+        if tmp.exists():
+            tmp.unlink()
+
+        LOG.debug('Unable to save feed cache for {url}: {error}'.format(url=u, error=e))
+
+
+def packages(u, names=None):
+    """Raw 'Packages' dictionary of a feed URL, fetched only if it has changed since it was cached, or only the packages with the
+    download names given if names are specified, returns a dictionary or None"""
+    result = None
+    f, _ = paths(u)
+
+    # Feeds checked for changes recently that the package index says don't have the packages aren't touched at all
+    indexed = bool(names) and index.INDEX.fresh(u)
+
+    if indexed and not index.INDEX.keys(u, names):
+        LOG.debug('No packages found in the package index of {plist}'.format(plist=u))
+
+        return result
+
+    cached = load(u) if not ARGS.refresh_metadata else None
+    validators = (cached or dict()).get('validators', dict())
+
+    # NOTE: Always get this property list silently even in a dry run. It's read straight from memory.
+    status, headers, body = curl.get_conditional(u, validators=validators, http2=ARGS.http2, insecure=ARGS.insecure)
+
+    if status == 200 and body:
+        LOG.debug('Fetched {plist}'.format(plist=u))
+        result = plist.read_string(body, keys=['Packages']).get('Packages', None)
+        validators = {_k: _v for _k, _v in headers.items() if _k in VALIDATORS}
+        save(u, body, validators, result)
+        index.INDEX.update(u, result, validators)
+    elif cached and status in [0, 304]:
+        # Unchanged, or unreachable, feeds are answered from the cache without parsing the property list again
+        LOG.debug('Using cached {plist} ({status})'.format(plist=u, status='not modified' if status == 304 else 'unreachable'))
+        result = cached.get('packages', None) or plist.read(f, keys=['Packages']).get('Packages', None)
+
+        # Only a feed the server says is unchanged counts as checked
+        if status == 304:
+            index.INDEX.update(u, result, validators)
+    else:
+        LOG.info('{plist} not found'.format(plist=u))
+
+    # Feeds that do have the packages are still checked for changes, only the packages asked for are answered
+    if indexed and result:
+        keys = index.INDEX.keys(u, names)
+        LOG.debug('Found {count} packages in the package index of {plist}'.format(count=len(keys), plist=u))
+        result = {_k: result[_k] for _k in keys if _k in result} or None
+
+    return result
@@ -0,0 +1,51 @@
+import hashlib
+import logging
+
+LOG = logging.getLogger(__name__)
+CHUNK_SIZE = 1024 * 1024
+
+
+class StreamingHash:
+    """Hash of bytes as they are written to a file, tracking how many bytes have been hashed."""
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.length = 0
+        self._hash = hashlib.new(algorithm)
+
+    def update(self, data):
+        """Hash the next bytes written"""
+        self._hash.update(data)
+        self.length += len(data)
+
+    def hexdigest(self):
+        """Hex digest of the bytes hashed so far"""
+        return self._hash.hexdigest()
+
+
+def read(f, digest, length=None):
+    """Hash the bytes of a file (or the first length bytes) into a StreamingHash, returns the StreamingHash"""
+    result = digest
+    remaining = length
+
+    with open(f, 'rb') as _f:
+        while remaining is None or remaining > 0:
+            chunk = _f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+
+            if not chunk:
+                break
+
+            result.update(chunk)
+
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    LOG.debug('Read {length} bytes of {f} to hash'.format(length=result.length, f=f))
+
+    return result
+
+
+def file_hash(f, algorithm):
+    """Hash a whole file, returns the hex digest"""
+    result = read(f, StreamingHash(algorithm)).hexdigest()
+
+    return result
@@ -0,0 +1,452 @@
+import http.client
+import logging
+import os
+import ssl
+import sys
+import zlib
+
+from base64 import b64encode
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from threading import BoundedSemaphore, Event, Lock
+from urllib.parse import unquote, urljoin, urlparse
+from urllib.request import getproxies, proxy_bypass
+
+from . import hashing
+from . import DOWNLOAD_HOST_LIMIT
+from . import USER_AGENT
+
+LOG = logging.getLogger(__name__)
+CHUNK_SIZE = 1024 * 1024
+MAX_IDLE = 8  # Idle connections kept per host
+MAX_REDIRECTS = 10
+REDIRECT_STATUS = [301, 302, 303, 307, 308]
+TIMEOUT = 60
+
+Response = namedtuple('Response', ['status', 'headers', 'url'])
+STOP = Event()  # Set to abandon transfers in progress, such as on a keyboard interrupt
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections, pooled per scheme, host and port."""
+    def __init__(self, max_idle=MAX_IDLE, timeout=TIMEOUT, host_limit=DOWNLOAD_HOST_LIMIT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.host_limit = host_limit
+        self._idle = dict()
+        self._slots = dict()
+        self._lock = Lock()
+
+    def _key(self, url, insecure):
+        """Pool key for a parsed URL"""
+        result = (url.scheme, url.hostname, url.port, insecure)
+
+        return result
+
+    def acquire(self, url, insecure=False, fresh=False):
+        """Return a tuple of an idle or new connection at [0] and if it was reused at [1]"""
+        result = None
+
+        with self._lock:
+            idle = self._idle.get(self._key(url, insecure), list())
+
+            if idle and not fresh:
+                result = (idle.pop(), True)
+
+        if not result:
+            _proxy = proxy(url)
+
+            # HTTPS is tunnelled through a proxy, HTTP requests are sent to the proxy with the absolute URL (see 'request')
+            if url.scheme == 'https' and _proxy:
+                conn = http.client.HTTPSConnection(_proxy.hostname, _proxy.port, timeout=self.timeout, context=tls_context(insecure))
+                conn.set_tunnel(url.hostname, url.port, headers=proxy_headers(_proxy))
+            elif url.scheme == 'https':
+                conn = http.client.HTTPSConnection(url.hostname, url.port, timeout=self.timeout, context=tls_context(insecure))
+            elif _proxy:
+                conn = http.client.HTTPConnection(_proxy.hostname, _proxy.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+
+            result = (conn, False)
+
+        return result
+
+    def slots(self, url):
+        """Semaphore capping the connections downloads hold to the host of a parsed URL"""
+        with self._lock:
+            if url.netloc not in self._slots:
+                self._slots[url.netloc] = BoundedSemaphore(self.host_limit)
+
+            result = self._slots[url.netloc]
+
+        return result
+
+    def release(self, conn, url, insecure=False, response=None):
+        """Return a connection to the pool if it can be kept alive"""
+        if response is not None and response.will_close:
+            conn.close()
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(self._key(url, insecure), list())
+
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                conn = None
+
+        if conn:
+            conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            for _, idle in self._idle.items():
+                for conn in idle:
+                    conn.close()
+
+            self._idle.clear()
+
+
+POOL = ConnectionPool()
+
+
+def proxy(url):
+    """Proxy for a parsed URL from the environment ('http_proxy', 'https_proxy' and 'no_proxy'), or the system proxy
+    settings, as cURL would use, returns a parsed URL or None"""
+    result = None
+    proxies = getproxies()
+
+    if proxies.get(url.scheme) and not proxy_bypass(url.hostname):
+        _proxy = proxies[url.scheme]
+        result = urlparse(_proxy if '://' in _proxy else 'http://{proxy}'.format(proxy=_proxy))
+
+    return result
+
+
+def proxy_headers(url):
+    """Authorization header for a parsed proxy URL with credentials, returns a dictionary"""
+    result = dict()
+
+    if url.username:
+        credentials = '{user}:{password}'.format(user=unquote(url.username), password=unquote(url.password or ''))
+        result['Proxy-Authorization'] = 'Basic {credentials}'.format(credentials=b64encode(credentials.encode('utf-8')).decode('ascii'))
+
+    return result
+
+
+def tls_context(insecure=False):
+    """TLS context, certificate checks are disabled if insecure"""
+    result = ssl.create_default_context()
+
+    # Insecure TLS - not recommended
+    if insecure:
+        result.check_hostname = False
+        result.verify_mode = ssl.CERT_NONE
+
+    return result
+
+
+def send(conn, method, path, headers):
+    """Send a request on a connection, closing the connection if it fails, returns the response"""
+    try:
+        conn.request(method, path, headers=headers)
+        result = conn.getresponse()
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        raise
+
+    return result
+
+
+def request(method, u, headers=None, insecure=False):
+    """Send a request following redirects, returns a tuple of (response, connection, parsed url)"""
+    _headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'}
+    _headers.update(headers or dict())
+
+    # Convert URL from path object to string if path
+    if isinstance(u, (Path, PurePath)):
+        u = str(u)
+
+    for _ in range(MAX_REDIRECTS + 1):
+        url = urlparse(u)
+        path = '{path}?{query}'.format(path=url.path or '/', query=url.query) if url.query else url.path or '/'
+        conn, reused = POOL.acquire(url, insecure)
+        _proxy = proxy(url) if url.scheme == 'http' else None
+        _sent = dict(_headers)
+
+        # Requests through an HTTP proxy name the whole URL, proxy credentials only go to the proxy
+        if _proxy:
+            path = '{scheme}://{netloc}{path}'.format(scheme=url.scheme, netloc=url.netloc, path=path)
+            _sent.update(proxy_headers(_proxy))
+
+        try:
+            response = send(conn, method, path, _sent)
+        except (OSError, http.client.HTTPException):
+            # A kept alive connection may have been closed by the server, retry once on a new one
+            if not reused:
+                raise
+
+            conn, _ = POOL.acquire(url, insecure, fresh=True)
+            response = send(conn, method, path, _sent)
+
+        location = response.getheader('location')
+
+        if response.status in REDIRECT_STATUS and location:
+            response.read()
+            POOL.release(conn, url, insecure, response)
+            u = urljoin(u, location)
+            LOG.debug('{method} redirected to {url}'.format(method=method, url=u))
+
+            if response.status == 303 and method != 'HEAD':
+                method = 'GET'
+
+            continue
+
+        return (response, conn, u)
+
+    raise http.client.HTTPException('Maximum redirects exceeded for {url}'.format(url=u))
+
+
+def head(u, headers=None, insecure=False):
+    """Headers of an HTTP/HTTPS resource, returns a Response namedtuple"""
+    result = Response(status=0, headers=list(), url=str(u))
+    conn = None
+
+    try:
+        response, conn, final_url = request('HEAD', u, headers=headers, insecure=insecure)
+        response.read()
+        POOL.release(conn, urlparse(final_url), insecure, response)
+        result = Response(status=response.status, headers=response.getheaders(), url=final_url)
+    except (OSError, http.client.HTTPException) as e:
+        if conn:
+            conn.close()
+
+        LOG.debug('HEAD {url} failed: {error}'.format(url=u, error=e))
+
+    LOG.debug('HEAD {url} ({http_status})'.format(url=u, http_status=result.status))
+
+    return result
+
+
+def progress(done, total):
+    """Write a progress bar similar to the cURL progress bar"""
+    if total:
+        percent = min(done / total * 100, 100.0)
+        bar = '#' * int(percent / 100 * 60)
+        sys.stderr.write('\r{bar:<60} {percent:5.1f}%'.format(bar=bar, percent=percent))
+        sys.stderr.flush()
+
+
+def get(u, dest, quiet=False, resume=False, compressed=False, insecure=False, digest=None):
+    """Fetch HTTP/HTTPS resource to local destination, hashing the bytes written into digest, returns the HTTP status"""
+    result = 0
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    headers = dict()
+    offset = 0
+
+    # Resuming a compressed transfer is not possible as the offsets refer to the encoded bytes
+    if resume and not compressed and dest.exists():
+        offset = dest.stat().st_size
+        headers['Range'] = 'bytes={offset}-'.format(offset=offset)
+
+    if compressed:
+        headers['Accept-Encoding'] = 'gzip'
+
+    conn = None
+
+    try:
+        response, conn, final_url = request('GET', u, headers=headers, insecure=insecure)
+        result = response.status
+
+        # Nothing left to fetch, or the server doesn't have it, don't write error pages out
+        if response.status == 416 or response.status >= 400:
+            response.read()
+            POOL.release(conn, urlparse(final_url), insecure, response)
+            LOG.debug('GET {url} ({http_status})'.format(url=u, http_status=result))
+
+            return result
+
+        mode = 'ab' if response.status == 206 else 'wb'
+        done = offset if response.status == 206 else 0
+        total = done + int(response.getheader('content-length', 0) or 0)
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if response.getheader('content-encoding') == 'gzip' else None
+
+        # The bytes already on disk are part of the hash when resuming
+        if digest and response.status == 206:
+            hashing.read(dest, digest, length=offset)
+
+        with open(dest, mode) as _f:
+            while True:
+                # Reading whatever has arrived, rather than waiting for a whole chunk, so a stop is noticed promptly
+                if STOP.is_set():
+                    raise InterruptedError('Transfer stopped')
+
+                chunk = response.read1(CHUNK_SIZE)
+
+                if not chunk:
+                    break
+
+                done += len(chunk)
+                data = decoder.decompress(chunk) if decoder else chunk
+                _f.write(data)
+
+                if digest:
+                    digest.update(data)
+
+                if not quiet:
+                    progress(done, total)
+
+            if decoder:
+                data = decoder.flush()
+                _f.write(data)
+
+                if digest:
+                    digest.update(data)
+
+        if not quiet:
+            sys.stderr.write('\n')
+
+        POOL.release(conn, urlparse(final_url), insecure, response)
+    except (OSError, http.client.HTTPException, zlib.error) as e:
+        # A connection that failed part way through a response can't go back in the pool, and the transfer is incomplete
+        if conn:
+            conn.close()
+
+        result = 0
+
+        LOG.debug('GET {url} failed: {error}'.format(url=u, error=e))
+
+    LOG.debug('GET {url} -> {dest} ({http_status})'.format(url=u, dest=dest, http_status=result))
+
+    return result
+
+
+def get_conditional(u, validators=None, insecure=False):
+    """Fetch HTTP/HTTPS resource into memory unless it hasn't changed since the validators, returns a tuple of a Response namedtuple
+    and the (decoded) body, which is empty unless the status is 200"""
+    result = (Response(status=0, headers=list(), url=str(u)), b'')
+    headers = {'Accept-Encoding': 'gzip'}
+    validators = validators or dict()
+
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+
+    if validators.get('last-modified'):
+        headers['If-Modified-Since'] = validators['last-modified']
+
+    conn = None
+
+    try:
+        response, conn, final_url = request('GET', u, headers=headers, insecure=insecure)
+        body = bytearray()
+
+        # Not modified, or not found, there is nothing to keep
+        if response.status == 200:
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if response.getheader('content-encoding') == 'gzip' else None
+
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+
+                if not chunk:
+                    break
+
+                body.extend(decoder.decompress(chunk) if decoder else chunk)
+
+            if decoder:
+                body.extend(decoder.flush())
+        else:
+            response.read()
+
+        POOL.release(conn, urlparse(final_url), insecure, response)
+        result = (Response(status=response.status, headers=response.getheaders(), url=final_url), bytes(body))
+    except (OSError, http.client.HTTPException, zlib.error) as e:
+        if conn:
+            conn.close()
+
+        LOG.debug('GET {url} failed: {error}'.format(url=u, error=e))
+
+    LOG.debug('GET {url} ({http_status}, {length} bytes)'.format(url=u, http_status=result[0].status, length=len(result[1])))
+
+    return result
+
+
+def get_range(u, fd, start, end, insecure=False):
+    """Fetch bytes start to end (inclusive) of an HTTP/HTTPS resource into an open file descriptor, returns bytes written"""
+    result = 0
+    response, conn, final_url = request('GET', u, headers={'Range': 'bytes={start}-{end}'.format(start=start, end=end)}, insecure=insecure)
+
+    # Anything other than partial content would write the wrong bytes at this offset, and the body could be the whole
+    # resource, so the connection is dropped rather than read to the end
+    if response.status != 206:
+        conn.close()
+        LOG.debug('GET {url} range {start}-{end} ({http_status})'.format(url=u, start=start, end=end, http_status=response.status))
+
+        return result
+
+    try:
+        while True:
+            if STOP.is_set():
+                raise InterruptedError('Transfer stopped')
+
+            chunk = response.read1(CHUNK_SIZE)
+
+            if not chunk:
+                break
+
+            os.pwrite(fd, chunk, start + result)
+            result += len(chunk)
+    except (OSError, http.client.HTTPException):
+        # A connection that failed part way through a range can't go back in the pool
+        conn.close()
+        raise
+
+    POOL.release(conn, urlparse(final_url), insecure, response)
+
+    return result
+
+
+def get_segmented(u, dest, size, segments, insecure=False):
+    """Fetch HTTP/HTTPS resource as concurrent byte ranges into a preallocated file, returns the HTTP status"""
+    result = 0
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    step = -(-size // segments)  # Ceiling division so the last segment is the shortest
+    ranges = [(_s, min(_s + step, size) - 1) for _s in range(0, size, step)]
+
+    # The download holds one of the connections to the host it's allowed, ranges are only fetched on more connections
+    # if other downloads from the host aren't using them
+    slots = POOL.slots(urlparse(str(u)))
+    extra = 0
+
+    while extra < min(len(ranges), POOL.host_limit) - 1 and slots.acquire(blocking=False):
+        extra += 1
+
+    LOG.debug('GET {url} in {count} segments of {step} bytes on {conns} connections'.format(url=u, count=len(ranges), step=step,
+                                                                                          conns=extra + 1))
+
+    with open(dest, 'wb') as _f:
+        _f.truncate(size)
+        fd = _f.fileno()
+
+        try:
+            with ThreadPoolExecutor(max_workers=extra + 1, thread_name_prefix='segment') as executor:
+                received = list(executor.map(lambda _r: get_range(u, fd, _r[0], _r[1], insecure=insecure), ranges))
+        except (OSError, http.client.HTTPException) as e:
+            LOG.debug('GET {url} segment failed: {error}'.format(url=u, error=e))
+            received = list()
+        finally:
+            for _ in range(extra):
+                slots.release()
+
+    # Verify the assembled length against the expected length of every range and the whole file
+    if received == [_e - _s + 1 for _s, _e in ranges] and dest.stat().st_size == size:
+        result = 206
+    else:
+        LOG.debug('GET {url} segmented download incomplete, removing {dest}'.format(url=u, dest=dest))
+        dest.unlink(missing_ok=True)
+
+    LOG.debug('GET {url} -> {dest} ({http_status})'.format(url=u, dest=dest, http_status=result))
+
+    return result
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+
+from datetime import datetime
+from pathlib import PurePath
+from threading import Lock
+
+from . import ARGS
+from . import FEED_INDEX
+from . import FEED_INDEX_TTL
+
+LOG = logging.getLogger(__name__)
+
+
+class PackageIndex:
+    """Persistent index of the download names of the packages in each feed, so the feeds holding a package are known without loading every feed."""
+    def __init__(self, f=FEED_INDEX, ttl=FEED_INDEX_TTL):
+        self.f = f
+        self.ttl = ttl
+        self.feeds = dict()  # Feed URL to the validators and time it was last checked, and download names to package keys
+        self.changed = False
+        self._lock = Lock()
+        self.load()
+
+    def load(self):
+        """Load the index file, an unreadable index is treated as empty"""
+        try:
+            with open(self.f, 'r') as _f:
+                self.feeds = json.load(_f).get('feeds', dict())
+
+            LOG.debug('Loaded package index of {count} feeds from {f}'.format(count=len(self.feeds), f=self.f))
+        except (OSError, ValueError, AttributeError) as e:
+            LOG.debug('No package index loaded from {f}: {error}'.format(f=self.f, error=e))
+
+    def fresh(self, u):
+        """Feed is indexed and was checked for changes within the TTL, returns a boolean"""
+        with self._lock:
+            entry = self.feeds.get(str(u), None)
+            result = bool(entry) and not ARGS.refresh_metadata and datetime.now().timestamp() - entry['checked'] <= self.ttl
+
+        return result
+
+    def keys(self, u, names):
+        """Package keys in a feed of the download names given, returns a list"""
+        with self._lock:
+            indexed = self.feeds.get(str(u), dict()).get('names', dict())
+            result = [_k for _n in names for _k in indexed.get(_n, list())]
+
+        return result
+
+    def update(self, u, packages, validators):
+        """Index the packages of a feed that has been checked for changes, re-indexing it if its validators changed"""
+        now = datetime.now().timestamp()
+
+        with self._lock:
+            entry = self.feeds.get(str(u), None)
+
+            if not entry or entry['validators'] != validators or not validators:
+                names = dict()
+
+                for _k, _attrs in (packages or dict()).items():
+                    if _attrs.get('DownloadName'):
+                        names.setdefault(str(PurePath(_attrs['DownloadName']).name), list()).append(_k)
+
+                entry = self.feeds[str(u)] = {'validators': validators, 'names': names}
+                LOG.debug('Indexed {count} packages in {url}'.format(count=len(names), url=u))
+
+            entry['checked'] = now
+            self.changed = True
+
+    def save(self):
+        """Write the index out if it has changed"""
+        if not self.changed:
+            return
+
+        tmp = self.f.with_name('{name}.tmp'.format(name=self.f.name))
+
+        try:
+            self.f.parent.mkdir(parents=True, exist_ok=True)
+
+            with self._lock:
+                with open(tmp, 'w') as _f:
+                    json.dump({'feeds': self.feeds}, _f)
+
+                os.replace(tmp, self.f)
+                self.changed = False
+
+            LOG.debug('Saved package index of {count} feeds to {f}'.format(count=len(self.feeds), f=self.f))
+        except OSError as e:
+            LOG.debug('Unable to save package index to {f}: {error}'.format(f=self.f, error=e))
+
+
+INDEX = PackageIndex()
+
+
+def save():
+    """Save the package index"""
+    INDEX.save()
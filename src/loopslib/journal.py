@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+
+from . import DOWNLOAD_JOURNAL
+
+LOG = logging.getLogger(__name__)
+VALIDATORS = ['etag', 'last-modified']
+
+
+def partial(dest):
+    """Path a destination is downloaded into before it is complete"""
+    dest = Path(dest)
+    result = dest.with_name('{name}.part'.format(name=dest.name))
+
+    return result
+
+
+class DownloadJournal:
+    """Persistent record of package downloads keyed by destination, so interrupted runs can resume."""
+    def __init__(self, f=DOWNLOAD_JOURNAL):
+        self.f = f
+        self.entries = dict()  # Destination to url, expected length, bytes received, completion, validators and hash
+        self.changed = False
+        self._lock = Lock()
+        self.load()
+
+    def load(self):
+        """Load the journal file, entries for files that no longer exist are dropped"""
+        try:
+            with open(self.f, 'r') as _f:
+                data = json.load(_f)
+
+            self.entries = {_d: _e for _d, _e in data.get('entries', dict()).items() if Path(_d).exists() or partial(_d).exists()}
+            self.changed = len(self.entries) != len(data.get('entries', dict()))
+            LOG.debug('Loaded {count} download journal entries from {f}'.format(count=len(self.entries), f=self.f))
+        except (OSError, ValueError, AttributeError) as e:
+            LOG.debug('No download journal loaded from {f}: {error}'.format(f=self.f, error=e))
+
+    def get(self, dest):
+        """Return a copy of the journal entry for a destination"""
+        with self._lock:
+            result = dict(self.entries[str(dest)]) if str(dest) in self.entries else None
+
+        return result
+
+    def completed(self, dest):
+        """Return the journal entry for a destination if it finished downloading and is unchanged on disk"""
+        result = None
+        entry = self.get(dest)
+        dest = Path(dest)
+
+        if entry and entry['complete'] and dest.exists() and dest.stat().st_size == entry['received']:
+            result = entry
+
+        return result
+
+    def begin(self, dest, u, expected, segmented=False, validators=None):
+        """Record a download starting, returns the path of the partial file to download into"""
+        dest = Path(dest)
+        result = partial(dest)
+        entry = self.get(dest) or dict()
+
+        # Segmented downloads preallocate the whole file, so an interrupted one can't be resumed by length
+        if entry.get('segmented') and not entry.get('complete'):
+            result.unlink(missing_ok=True)
+
+        # Files downloaded before there was a journal entry for them are adopted
+        if dest.exists() and not result.exists():
+            size = dest.stat().st_size
+
+            if size == expected or not expected:
+                self.finish(dest, u, expected, received=size, complete=True, validators=validators)
+                LOG.debug('Adopted existing download {dest} ({size} bytes)'.format(dest=dest, size=size))
+
+                return None
+            elif size < expected:
+                os.replace(dest, result)
+
+        received = result.stat().st_size if result.exists() else 0
+        self.finish(dest, u, expected, received=received, complete=False, segmented=segmented, validators=validators)
+        LOG.debug('Downloading {url} to {part} ({received} of {expected} bytes received)'.format(url=u, part=result,
+                                                                                              received=received, expected=expected))
+
+        return result
+
+    def finish(self, dest, u, expected, received, complete, segmented=False, validators=None, digest=None):
+        """Record the state of a download, validators are the response headers identifying the version downloaded"""
+        with self._lock:
+            self.entries[str(dest)] = {'url': u,
+                                       'expected': expected,
+                                       'received': received,
+                                       'complete': complete,
+                                       'segmented': segmented,
+                                       'validators': {_k: _v for _k, _v in (validators or dict()).items() if _k in VALIDATORS},
+                                       'hash': {'algorithm': digest.algorithm, 'digest': digest.hexdigest()} if digest else None,
+                                       'updated': datetime.now().timestamp()}
+            self.changed = True
+
+    def update(self, dest, **kwargs):
+        """Update fields of an existing journal entry"""
+        with self._lock:
+            if str(dest) in self.entries:
+                self.entries[str(dest)].update(kwargs)
+                self.changed = True
+
+    def discard(self, dest):
+        """Remove a destination, any partial download of it, and its journal entry"""
+        Path(dest).unlink(missing_ok=True)
+        partial(dest).unlink(missing_ok=True)
+
+        with self._lock:
+            if self.entries.pop(str(dest), None):
+                self.changed = True
+
+    def save(self):
+        """Write the journal out if it has changed"""
+        if not self.changed:
+            return
+
+        tmp = self.f.with_name('{name}.tmp'.format(name=self.f.name))
+
+        try:
+            self.f.parent.mkdir(parents=True, exist_ok=True)
+
+            with self._lock:
+                with open(tmp, 'w') as _f:
+                    json.dump({'entries': self.entries}, _f)
+
+                os.replace(tmp, self.f)
+                self.changed = False
+
+            LOG.debug('Saved {count} download journal entries to {f}'.format(count=len(self.entries), f=self.f))
+        except OSError as e:
+            LOG.debug('Unable to save download journal to {f}: {error}'.format(f=self.f, error=e))
+
+
+JOURNAL = DownloadJournal()
+
+
+def save():
+    """Save the download journal"""
+    JOURNAL.save()
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+
+from functools import lru_cache
+from pathlib import Path, PurePath
+from threading import Lock
+from urllib.parse import urlparse
+
+from . import curl
+from . import hashing
+from . import journal
+from . import ARGS
+from . import DMG_MOUNT
+from . import MIRROR_MANIFEST
+from . import TEMPDIR
+
+LOG = logging.getLogger(__name__)
+PKG_SERVER_IS_DMG = True if ARGS.pkg_server and str(ARGS.pkg_server).endswith('.dmg') else False
+
+
+class MirrorManifest:
+    """Sizes and hashes of the packages in a mirror, keyed by path relative to the mirror root."""
+    def __init__(self, root, algorithm):
+        self.root = root
+        self.algorithm = algorithm
+        self.entries = dict()
+        self.names = dict()  # File name to path, for flat mirrors
+        self.changed = False
+        self._lock = Lock()
+
+    def load(self, f):
+        """Load a manifest file, an unreadable manifest is treated as empty"""
+        try:
+            with open(f, 'r') as _f:
+                data = json.load(_f)
+
+            self.entries = data.get('packages', dict())
+            self.names = {PurePath(_p).name: _p for _p in self.entries}
+            self.algorithm = data.get('algorithm', self.algorithm)
+            LOG.debug('Loaded {count} mirror manifest entries from {f}'.format(count=len(self.entries), f=f))
+        except (OSError, ValueError, AttributeError) as e:
+            LOG.debug('No mirror manifest loaded from {f}: {error}'.format(f=f, error=e))
+
+    def get(self, relpath):
+        """Return the entry for a path, falling back to the file name for flat mirrors"""
+        with self._lock:
+            result = self.entries.get(relpath, None) or self.entries.get(self.names.get(PurePath(relpath).name), None)
+
+        return result
+
+    def put(self, relpath, size, digest, accept_ranges=False):
+        """Record the size, hash (a dictionary of 'algorithm' and 'digest') and resume support of a package"""
+        with self._lock:
+            self.entries[relpath] = {'relpath': relpath, 'size': size, 'hash': digest, 'accept_ranges': accept_ranges}
+            self.names[PurePath(relpath).name] = relpath
+            self.changed = True
+
+    def save(self):
+        """Write the manifest to the mirror root if it has changed"""
+        if not self.changed:
+            return
+
+        f = Path(self.root) / MIRROR_MANIFEST
+        tmp = f.with_name('{name}.tmp'.format(name=f.name))
+
+        try:
+            with self._lock:
+                with open(tmp, 'w') as _f:
+                    json.dump({'algorithm': self.algorithm, 'packages': self.entries}, _f, indent=2, sort_keys=True)
+
+                os.replace(tmp, f)
+                self.changed = False
+
+            LOG.debug('Saved {count} mirror manifest entries to {f}'.format(count=len(self.entries), f=f))
+        except OSError as e:
+            LOG.debug('Unable to save mirror manifest to {f}: {error}'.format(f=f, error=e))
+
+
+@lru_cache(maxsize=None)
+def mirror():
+    """The manifest of the mirror downloaded to, or deployed from, in this run, returns a MirrorManifest or None"""
+    result = None
+
+    if not ARGS.deployment:
+        result = MirrorManifest(root=DMG_MOUNT if ARGS.build_dmg else ARGS.destination, algorithm=ARGS.hash_algorithm)
+        result.load(Path(result.root) / MIRROR_MANIFEST)
+    elif ARGS.pkg_server and PKG_SERVER_IS_DMG:
+        result = MirrorManifest(root=DMG_MOUNT, algorithm=ARGS.hash_algorithm)
+        result.load(Path(DMG_MOUNT) / MIRROR_MANIFEST)
+    elif ARGS.pkg_server:
+        result = MirrorManifest(root=str(ARGS.pkg_server), algorithm=ARGS.hash_algorithm)
+        u = '{mirror}/{manifest}'.format(mirror=str(ARGS.pkg_server).rstrip('/'), manifest=MIRROR_MANIFEST)
+
+        # The manifest is fetched with a single GET, there is nothing a probe would tell us first
+        curl.prime(u, curl.to_probe(status=200, headers=dict(), url=u))
+        f = curl.get(u=u, dest=TEMPDIR / MIRROR_MANIFEST, quiet=True, http2=ARGS.http2, insecure=ARGS.insecure)
+
+        if f:
+            result.load(f)
+
+    # Downloads are hashed with the algorithm of the mirror so they can be verified against it
+    if result and result.algorithm != ARGS.hash_algorithm:
+        LOG.info('Mirror manifest uses {algorithm}, overriding --hash-algorithm {requested}'.format(algorithm=result.algorithm,
+                                                                                                    requested=ARGS.hash_algorithm))
+        curl.configure(algorithm=result.algorithm)
+
+    return result
+
+
+def relpath(pkg):
+    """Path of a package relative to the mirror root"""
+    if not ARGS.deployment:
+        result = os.path.relpath(pkg.download_dest, DMG_MOUNT if ARGS.build_dmg else ARGS.destination)
+    elif PKG_SERVER_IS_DMG:
+        result = os.path.relpath(pkg.url, DMG_MOUNT)
+    else:
+        result = url_relpath(pkg.url)
+
+    return result
+
+
+def url_relpath(u):
+    """Path of a package URL relative to the package server mirror"""
+    result = os.path.relpath(urlparse(str(u)).path, urlparse(str(ARGS.pkg_server)).path or '/')
+
+    return result
+
+
+def entry(u):
+    """Manifest entry for a package URL when deploying from an HTTP package server mirror, returns a dictionary or None"""
+    result = None
+
+    if ARGS.deployment and ARGS.pkg_server and not PKG_SERVER_IS_DMG and mirror():
+        result = mirror().get(url_relpath(u))
+
+    return result
+
+
+def to_probe(u, mirrored):
+    """Create a Probe for a package URL from its manifest entry"""
+    headers = {'content-length': mirrored['size']}
+
+    if mirrored.get('accept_ranges'):
+        headers['accept-ranges'] = 'bytes'
+
+    if mirrored.get('hash'):
+        headers['etag'] = '"{digest}"'.format(digest=mirrored['hash']['digest'])
+
+    result = curl.to_probe(status=200, headers=headers, url=str(u))
+
+    return result
+
+
+def prime(urls):
+    """Share manifest entries with 'curl.probe' so mirrored packages aren't probed, returns the URLs not in the manifest"""
+    result = list()
+
+    for u in urls:
+        mirrored = entry(u)
+
+        if mirrored:
+            curl.prime(u, to_probe(u, mirrored))
+        else:
+            result.append(u)
+
+    return result
+
+
+def record(pkg, read=False):
+    """Record the size and hash of a downloaded package in the mirror manifest, read it to hash it if it wasn't hashed when downloaded"""
+    entry = journal.JOURNAL.completed(pkg.download_dest)
+
+    if entry and entry.get('hash'):
+        mirror().put(relpath(pkg), entry['received'], entry['hash'], accept_ranges=pkg.download_resume)
+    elif read and pkg.download_dest.exists():
+        digest = hashing.read(pkg.download_dest, hashing.StreamingHash(ARGS.hash_algorithm))
+        mirror().put(relpath(pkg), digest.length, {'algorithm': digest.algorithm, 'digest': digest.hexdigest()},
+                     accept_ranges=pkg.download_resume)
+
+
+def verify(pkg):
+    """Verify a downloaded package against the mirror manifest, returns False if the hash doesn't match"""
+    result = True
+    expected = mirror().get(relpath(pkg)) if mirror() else None
+    entry = journal.JOURNAL.completed(pkg.download_dest)
+
+    # Packages the mirror doesn't have a hash for, or that were hashed differently, can't be verified
+    if expected and expected.get('hash') and entry and entry.get('hash'):
+        if expected['hash']['algorithm'] == entry['hash']['algorithm']:
+            result = expected['hash']['digest'] == entry['hash']['digest']
+            LOG.debug('Verified {pkg} {algorithm} hash: {result}'.format(pkg=pkg.download_name, algorithm=entry['hash']['algorithm'], result=result))
+
+    return result
+
+
+def save():
+    """Save the mirror manifest when downloading to a mirror"""
+    if not ARGS.deployment and not ARGS.dry_run and mirror():
+        mirror().save()
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+from . import curl
+from . import snapshot
+from . import ARGS
+from . import METADATA_CACHE
+from . import METADATA_MAX_ENTRIES
+from . import METADATA_TTL
+
+LOG = logging.getLogger(__name__)
+CACHED_HEADERS = ['content-length', 'accept-ranges', 'cdnuuid', 'content-encoding', 'etag', 'last-modified']
+VALIDATORS = ['etag', 'last-modified']
+
+
+class MetadataCache:
+    """Persistent HTTP metadata of package URLs, keyed by final URL with LRU eviction, entries older than the TTL are revalidated."""
+    def __init__(self, f=METADATA_CACHE, ttl=METADATA_TTL, max_entries=METADATA_MAX_ENTRIES):
+        self.f = f
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # Final URL to metadata, least recently used first
+        self.aliases = dict()  # Requested URL to final URL
+        self.changed = False
+        self._lock = Lock()
+        self.load()
+
+    def load(self):
+        """Load the cache file, an unreadable cache is treated as empty"""
+        try:
+            with open(self.f, 'r') as _f:
+                data = json.load(_f)
+
+            self.entries = OrderedDict(sorted(data.get('entries', dict()).items(), key=lambda _e: _e[1]['accessed']))
+            self.aliases = data.get('aliases', dict())
+            LOG.debug('Loaded {count} cached metadata entries from {f}'.format(count=len(self.entries), f=self.f))
+        except (OSError, ValueError, KeyError) as e:
+            LOG.debug('No metadata cache loaded from {f}: {error}'.format(f=self.f, error=e))
+
+    def get(self, u):
+        """Return a Probe for a URL if cached and not expired, expired entries are kept so they can be revalidated"""
+        result = None
+        now = datetime.now().timestamp()
+
+        with self._lock:
+            final_url = self.aliases.get(u, u)
+            entry = self.entries.get(final_url, None)
+
+            if entry and now - entry['stored'] <= self.ttl:
+                entry['accessed'] = now
+                self.entries.move_to_end(final_url)
+                self.changed = True
+                result = curl.to_probe(status=entry['status'], headers=entry['headers'], url=final_url)
+
+        return result
+
+    def validators(self, u):
+        """Return the validators of the cached metadata of a URL, expired or not, returns a dictionary"""
+        with self._lock:
+            entry = self.entries.get(self.aliases.get(u, u), None)
+            result = {_k: _v for _k, _v in (entry or dict()).get('headers', dict()).items() if _k in VALIDATORS}
+
+        return result
+
+    def refresh(self, u):
+        """Mark the cached metadata of a URL as current once the server says it's unchanged, returns a Probe or None"""
+        result = None
+        now = datetime.now().timestamp()
+
+        with self._lock:
+            final_url = self.aliases.get(u, u)
+            entry = self.entries.get(final_url, None)
+
+            if entry:
+                entry['stored'], entry['accessed'] = now, now
+                self.entries.move_to_end(final_url)
+                self.changed = True
+                result = curl.to_probe(status=entry['status'], headers=entry['headers'], url=final_url)
+
+        return result
+
+    def put(self, u, probe):
+        """Cache the metadata of a successful probe"""
+        if probe.status != 200:
+            return
+
+        now = datetime.now().timestamp()
+
+        with self._lock:
+            self.entries[probe.url] = {'status': probe.status,
+                                       'headers': {_k: _v for _k, _v in probe.headers.items() if _k in CACHED_HEADERS},
+                                       'stored': now,
+                                       'accessed': now}
+            self.entries.move_to_end(probe.url)
+            self.changed = True
+
+            if u != probe.url:
+                self.aliases[u] = probe.url
+
+            while len(self.entries) > self.max_entries:
+                self._evict(next(iter(self.entries)))
+
+    def _evict(self, final_url):
+        """Remove an entry and any aliases of it"""
+        self.entries.pop(final_url, None)
+        self.aliases = {_k: _v for _k, _v in self.aliases.items() if _v != final_url}
+        self.changed = True
+
+    def save(self):
+        """Write the cache out if it has changed"""
+        if not self.changed:
+            return
+
+        tmp = self.f.with_name('{name}.tmp'.format(name=self.f.name))
+
+        try:
+            self.f.parent.mkdir(parents=True, exist_ok=True)
+
+            with self._lock:
+                with open(tmp, 'w') as _f:
+                    json.dump({'entries': self.entries, 'aliases': self.aliases}, _f)
+
+                os.replace(tmp, self.f)
+                self.changed = False
+
+            LOG.debug('Saved {count} cached metadata entries to {f}'.format(count=len(self.entries), f=self.f))
+        except OSError as e:
+            LOG.debug('Unable to save metadata cache to {f}: {error}'.format(f=self.f, error=e))
+
+
+CACHE = MetadataCache()
+
+
+def trusted():
+    """Cached (or snapshot) metadata can be used without revalidating it, which it can't when syncing as that looks for changes"""
+    result = not (ARGS.refresh_metadata or ARGS.sync)
+
+    return result
+
+
+def prime(urls):
+    """Share cached (or snapshot) metadata for URLs with 'curl.probe' so they aren't probed again"""
+    if trusted():
+        for u in urls:
+            probe = CACHE.get(str(u)) or snapshot.probe(u)
+
+            if probe:
+                curl.prime(u, probe)
+
+
+def probe(u):
+    """Probe a URL, consulting the persistent cache first, returns a Probe"""
+    result = CACHE.get(u) if trusted() else None
+
+    # Dry runs and comparisons fall back to the snapshot, which isn't persisted in the cache
+    if not result and trusted():
+        result = snapshot.probe(u)
+
+    if result:
+        curl.prime(u, result)
+    else:
+        result = revalidate(u)
+
+    return result
+
+
+def revalidate(u):
+    """Probe a URL conditionally on the validators of its cached metadata, if there are any, returns a Probe"""
+    # A URL already probed this run is current
+    result = curl.cached(u) or curl.probe(u, validators=CACHE.validators(u) if not ARGS.refresh_metadata else None)
+
+    # Unchanged resources keep their cached metadata for another TTL
+    if result.status == 304:
+        LOG.debug('Revalidated cached metadata for {url}'.format(url=u))
+        result = CACHE.refresh(u) or curl.probe(u)
+        curl.prime(u, result)
+    else:
+        CACHE.put(u, result)
+
+    return result
+
+
+def save():
+    """Save the persistent cache"""
+    CACHE.save()
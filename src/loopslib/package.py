@@ -5,8 +5,10 @@ import subprocess
 from pathlib import Path, PurePath
 from urllib.parse import urlparse
 
-from . import curl
+from . import journal
+from . import manifest
 from . import messages
+from . import metadata
 from . import pkgutil
 from . import versions
 from . import ARGS
@@ -26,6 +28,9 @@ FAILED.warning(ARGS)
 class LoopPackage:
     """Package object"""
     INSTANCES = set()  # Track created instances
+    __slots__ = ('package_id', 'download_name', 'file_check', 'installed_size', 'mandatory', 'version', 'url',
+                 'download_dest', 'badwolf_ignore', 'sequence_number', '_installed_version', '_installed', '_upgrade',
+                 '_headers', '_status')
 
     def __init__(self, **kwargs):
         self.package_id = kwargs.get('PackageID', None)
@@ -43,44 +48,119 @@ class LoopPackage:
                 self.installed_size = float(self.installed_size)
 
         # Set custom attributes
-        self.installed_version = pkgutil.pkg_version(self.package_id) if self.package_id else None
-        self.installed = pkgutil.is_installed(self.file_check, self.installed_version, self.version)
-        self.upgrade = pkgutil.upgrade_pkg(self.installed_version, self.version)
         self.url = self.parse_url(self.download_name)
         self.download_dest = self.parse_dest(self.url)
-        self.download_size, self.download_resume, self.cdn_uuid = self.parse_headers(self.url)
         self.badwolf_ignore = False
-        self.status = self.parse_http_status(self.url)
         self.download_name = str(PurePath(self.download_name).name)  # Make the download name friendly
         self.sequence_number = self.parse_seq_number(self.download_name)
 
-        # Set installed/upgrade values if force is required
-        if ARGS.force:
-            self.installed = False
-            self.upgrade = False
+        # Attributes that need a receipt lookup or an HTTP probe are computed on first access
+        self._installed_version = None
+        self._installed = None
+        self._upgrade = None
+        self._headers = None
+        self._status = None
 
         # Add self.package_id to INSTANCES tracker
         self.__class__.INSTANCES.add(self.package_id)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.identity == other.identity
         else:
             return NotImplemented
 
     def __ne__(self, other):
         if isinstance(other, self.__class__):
-            return not self.__dict__ == other.__dict__
+            return not self.identity == other.identity
         else:
             return NotImplemented
 
     def __hash__(self):
-        if isinstance(self, self.__class__):
-            return hash(self.package_id)
-        else:
-            return NotImplemented
+        return hash(self.identity)
+
+    @property
+    def identity(self):
+        """Tuple of package id and download URL, used for equality and hashing"""
+        return (self.package_id, self.url)
+
+    def as_dict(self):
+        """Dictionary of the package attributes"""
+        result = {_attr: getattr(self, _attr) for _attr in self.__slots__}
+
+        return result
+
+    @property
+    def installed_version(self):
+        """Installed version of the package, looked up on first access"""
+        if self._installed_version is None and self.package_id:
+            self._installed_version = pkgutil.pkg_version(self.package_id)
+
+        return self._installed_version
+
+    @property
+    def installed(self):
+        """Package is installed, always False if force is required"""
+        if ARGS.force:
+            return False
+
+        if self._installed is None:
+            self._installed = pkgutil.is_installed(self.file_check, self.installed_version, self.version)
+
+        return self._installed
+
+    @property
+    def upgrade(self):
+        """Package should be upgraded, always False if force is required"""
+        if ARGS.force:
+            return False
+
+        if self._upgrade is None:
+            self._upgrade = pkgutil.upgrade_pkg(self.installed_version, self.version)
+
+        return self._upgrade
+
+    @property
+    def download_size(self):
+        """Download size, probed on first access"""
+        return self.headers[0]
+
+    @property
+    def download_resume(self):
+        """Download can be resumed, probed on first access"""
+        return self.headers[1]
+
+    @property
+    def cdn_uuid(self):
+        """CDN UUID, probed on first access"""
+        return self.headers[2]
+
+    @property
+    def headers(self):
+        """Tuple of size, resume, CDN UUID parsed from headers on first access"""
+        if self._headers is None:
+            self._headers = self.parse_headers(self.url)
 
-    def _regex_parse_string(self, s):
+        return self._headers
+
+    @property
+    def status(self):
+        """HTTP status, probed on first access"""
+        if self._status is None:
+            self._status = self.parse_http_status(self.url)
+
+        return self._status
+
+    def prefetch(self):
+        """Resolve the lazy attributes that the current mode reads"""
+        self.headers
+
+        if ARGS.deployment and not ARGS.compare:
+            self.installed
+            self.upgrade
+
+    @staticmethod
+    def _regex_parse_string(s):
         """Parses a url/path to fix the folder path"""
         result = None
         reg = re.compile(r'lp10_ms3_content_2016/../lp10_ms3_content_2013')
@@ -94,8 +174,11 @@ class LoopPackage:
         result = 0
 
         if ARGS.deployment:
-            if urlparse(u).scheme:
-                result = curl.status(u)
+            # Packages in the manifest of a package server mirror exist without probing them
+            if urlparse(u).scheme and manifest.entry(u):
+                result = 200
+            elif urlparse(u).scheme:
+                result = metadata.probe(u).status
             elif PKG_SERVER_IS_DMG:
                 if Path(u).exists():
                     result = 200
@@ -104,21 +187,31 @@ class LoopPackage:
 
                 LOG.debug('Set HTTP status to {status} for local path'.format(status=result))
         else:
-            result = curl.status(u)
+            result = metadata.probe(u).status
 
         return result
 
     def parse_headers(self, u):
         """Parse information from headers, returns an tuple containing size, resume, CDN UUID"""
         result = None
-        headers = dict()
         size, resume, cdn_uuid = 0, False, None
 
-        if urlparse(u).scheme:
-            headers = curl.headers(self.url)
-            size = headers.get('content-length', 0)
-            resume = headers.get('accept-ranges', False) == 'bytes' or False
-            cdn_uuid = headers.get('cdnuuid', None)
+        # Completed downloads are known from the journal, so they don't need probing again unless syncing
+        entry = journal.JOURNAL.completed(self.download_dest) if urlparse(u).scheme and not (ARGS.force or ARGS.sync) else None
+
+        # Packages in the manifest of a package server mirror don't need probing either
+        mirrored = manifest.entry(u) if urlparse(u).scheme and not entry else None
+
+        # The probe is cached for the run and shared with 'curl.get', and persisted between runs
+        if entry:
+            size, resume = entry['received'], True
+            LOG.debug('Download size set to journaled size {size}'.format(size=size))
+        elif mirrored:
+            size, resume = mirrored['size'], mirrored.get('accept_ranges', False)
+            LOG.debug('Download size set to mirror manifest size {size}'.format(size=size))
+        elif urlparse(u).scheme:
+            probe = metadata.probe(u)
+            size, resume, cdn_uuid = probe.content_length, probe.accept_ranges, probe.cdn_uuid
 
         if ARGS.deployment and PKG_SERVER_IS_DMG and Path(u).exists():
             size = Path(u).stat().st_size
@@ -138,11 +231,12 @@ class LoopPackage:
 
         return result
 
-    def parse_url(self, n):
+    @staticmethod
+    def parse_url(n):
         """Parse a URL to use for downloading."""
         result = None
         url = '{feedurl}/{pkgname}'.format(feedurl=FEED_URL, pkgname=n)
-        url = self._regex_parse_string(url)
+        url = LoopPackage._regex_parse_string(url)
         _url = url
         LOG.debug('Set package URL to {url}'.format(url=url))
 
@@ -177,7 +271,8 @@ class LoopPackage:
 
         return result
 
-    def parse_dest(self, u):
+    @staticmethod
+    def parse_dest(u):
         """Parse a download destination."""
         result = None
         # Setting destination here avoids issues where disk space checks would fail if
@@ -193,14 +288,14 @@ class LoopPackage:
         if ARGS.deployment:
             if ARGS.pkg_server:
                 if PKG_SERVER_IS_DMG:
-                    dest = self.url
+                    dest = u
 
                     if ARGS.flat_mirror:
                         dest.replace(str(ARGS.destination), DMG_MOUNT).replace('lp10_ms3_content_2016/', '').replace('lp10_ms3_content_2013/', '')
                 else:
                     dest = '/tmp/appleloops/{package}'.format(package=PurePath(u).name)
 
-        result = Path(self._regex_parse_string(dest))
+        result = Path(LoopPackage._regex_parse_string(dest))
 
         return result
 
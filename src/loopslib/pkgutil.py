@@ -1,12 +1,24 @@
 import logging
+import os
 import subprocess
+import unicodedata
 
-from pathlib import Path
+from collections import namedtuple
+from pathlib import Path, PurePath
+from threading import Lock
+from xml.parsers.expat import ExpatError
 
 from . import plist
 from . import versions
+from . import RECEIPTS_DIR
 
 LOG = logging.getLogger(__name__)
+Receipt = namedtuple('Receipt', ['version', 'install_time'])
+Listing = namedtuple('Listing', ['names', 'folded'])  # Names in a directory, and the same names folded for comparison
+_RECEIPTS = None
+_RECEIPTS_LOCK = Lock()
+_LISTINGS = dict()  # Directory to a listing of the names in it, None if it doesn't exist, False if unreadable
+_LISTINGS_LOCK = Lock()
 
 
 def info(i):
@@ -24,9 +36,117 @@ def info(i):
     return result
 
 
+def receipts(d=RECEIPTS_DIR):
+    """Index installed package receipts in a single pass, returns a dictionary of package id and Receipt"""
+    result = dict()
+
+    try:
+        entries = [_e for _e in os.scandir(d) if _e.name.endswith('.plist')]
+    except OSError as e:
+        LOG.debug('Unable to read receipts in {d}: {error}'.format(d=d, error=e))
+        entries = list()
+
+    for entry in entries:
+        try:
+            receipt = plist.read(entry.path, keys=['PackageIdentifier', 'PackageVersion', 'InstallDate'])
+        except (OSError, ValueError, ExpatError) as e:
+            LOG.debug('Unable to read receipt {f}: {error}'.format(f=entry.path, error=e))
+            continue
+
+        package_id = receipt.get('PackageIdentifier', entry.name[:-len('.plist')])
+        result[package_id] = Receipt(version=versions.convert(receipt.get('PackageVersion', None)),
+                                     install_time=receipt.get('InstallDate', None))
+
+    LOG.debug('Indexed {count} installed package receipts from {d}'.format(count=len(result), d=d))
+
+    return result
+
+
+def installed_receipts():
+    """Installed package receipts, indexed once per run, returns a dictionary of package id and Receipt"""
+    global _RECEIPTS
+
+    with _RECEIPTS_LOCK:
+        if _RECEIPTS is None:
+            _RECEIPTS = receipts()
+
+    return _RECEIPTS
+
+
 def pkg_version(i):
-    """Return package version if installed, returns LooseVersion."""
-    return versions.convert(info(i).get('pkg-version', None))
+    """Return package version if installed, returns Version."""
+    receipt = installed_receipts().get(i, None)
+    result = receipt.version if receipt else versions.convert(None)
+
+    return result
+
+
+def listing(d):
+    """Names in a directory, listed once per run. Returns a Listing, None if missing, or False if unreadable"""
+    d = PurePath(d)
+
+    with _LISTINGS_LOCK:
+        if d in _LISTINGS:
+            return _LISTINGS[d]
+
+    # A directory missing from its parent's listing doesn't exist, so it doesn't need to be listed
+    parent = listing(d.parent) if d.name else False
+
+    if parent is None or (parent and not has_name(parent, d.name, d)):
+        result = None
+    else:
+        try:
+            with os.scandir(d) as _entries:
+                names = {_e.name for _e in _entries}
+
+            result = Listing(names, {fold(_n) for _n in names})
+        except (FileNotFoundError, NotADirectoryError):
+            result = None
+        except OSError:
+            result = False
+
+    with _LISTINGS_LOCK:
+        _LISTINGS[d] = result
+
+    return result
+
+
+def fold(name):
+    """Name in the form APFS compares names in, ignoring case and Unicode normalization, returns a string"""
+    result = unicodedata.normalize('NFD', name).casefold()
+
+    return result
+
+
+def has_name(names, name, p):
+    """Name is in a directory listing, case and normalization insensitive matches are confirmed on disk"""
+    result = name in names.names
+
+    if not result and fold(name) in names.folded:
+        result = Path(p).exists()
+
+    return result
+
+
+def exists(p):
+    """Path exists, answered from cached directory listings"""
+    p = PurePath(p)
+    names = listing(p.parent) if p.name else False
+
+    if names is None:
+        result = False
+    elif names is False:
+        result = Path(p).exists()
+    else:
+        result = has_name(names, p.name, p)
+
+    return result
+
+
+def prime_files(paths):
+    """List the parent directory of every path once, grouped by directory"""
+    for d in sorted({PurePath(_p).parent for _p in paths}):
+        listing(d)
 
 
 def is_installed(files, lcl_ver, pkg_ver):
@@ -35,11 +155,11 @@ def is_installed(files, lcl_ver, pkg_ver):
 
     if files:
         if isinstance(files, (set, list)) and len(files) == 1:
-            files = Path(files[0]).exists()
+            files = exists(files[0])
         elif isinstance(files, (set, list)) and len(files) > 1:
-            files = any([Path(_f).exists() for _f in files])
+            files = any([exists(_f) for _f in files])
         elif isinstance(files, str):
-            files = Path(files).exists()
+            files = exists(files)
         elif not files:
             files = False
 
@@ -1,19 +1,250 @@
 import plistlib
+import struct
 
+from base64 import b64decode
+from datetime import datetime, timedelta
+from io import BytesIO
+from xml.parsers.expat import ParserCreate
 
-def read(f):
-    """Read Property List"""
+BINARY_HEADER = b'bplist00'
+BINARY_EPOCH = datetime(2001, 1, 1)
+BINARY_INT_FORMATS = {1: 'B', 2: 'H', 4: 'L', 8: 'Q'}
+
+
+class XMLReader:
+    """Reads the values of selected top level keys of an XML property list, skipping over everything else."""
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.result = dict()
+        self._parser = ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self.start
+        self._parser.EndElementHandler = self.end
+        self._parser.CharacterDataHandler = self.characters
+        self._parser.EntityDeclHandler = self.entity
+        self._depth = 0  # The 'plist' element is depth 1, the top level dictionary 2, and its keys and values 3
+        self._skip = None  # Depth of the value being skipped
+        self._key = None  # Top level key of the value being read
+        self._stack = list()  # Dictionaries and arrays being read, with the pending key of each dictionary
+        self._data = list()
+
+    def parse(self, fp=None, s=None):
+        """Parse a file object or bytes, returns a dictionary of the selected keys"""
+        if fp is not None:
+            self._parser.ParseFile(fp)
+        else:
+            self._parser.Parse(s, True)
+
+        return self.result
+
+    def entity(self, *args, **kwargs):
+        # Same as plistlib, to avoid entity expansion attacks
+        raise plistlib.InvalidFileException('XML entity declarations are not supported in plist files')
+
+    def characters(self, data):
+        if self._skip is None:
+            self._data.append(data)
+
+    def start(self, tag, attrs):
+        self._depth += 1
+        self._data = list()
+
+        if self._skip is not None:
+            return
+
+        if self._depth == 2 and tag != 'dict':
+            raise ValueError('Top level of the property list is not a dictionary')
+        elif self._depth <= 2:
+            return
+
+        # Values of keys that weren't asked for, data blobs included, are never built
+        if self._depth == 3 and tag != 'key' and self._key not in self.keys:
+            self._skip = self._depth
+        elif tag in ['dict', 'array']:
+            self._stack.append([dict() if tag == 'dict' else list(), None])
+
+    def end(self, tag):
+        depth = self._depth
+        self._depth -= 1
+
+        if self._skip is not None:
+            self._skip = None if depth == self._skip else self._skip
+            return
+
+        if depth <= 2:
+            return
+
+        data = ''.join(self._data)
+
+        if tag == 'key' and depth == 3:
+            self._key = data
+        elif tag == 'key':
+            self._stack[-1][1] = data
+        elif tag in ['dict', 'array']:
+            self.add(self._stack.pop()[0])
+        else:
+            self.add(self.value(tag, data))
+
+    def add(self, value):
+        """Add a value to the dictionary or array being read, or to the result if it's a top level value"""
+        if not self._stack:
+            self.result[self._key] = value
+        elif isinstance(self._stack[-1][0], dict):
+            self._stack[-1][0][self._stack[-1][1]] = value
+        else:
+            self._stack[-1][0].append(value)
+
+    def value(self, tag, data):
+        """Convert the text of a scalar element, returns the value"""
+        result = None
+
+        if tag == 'string':
+            result = data
+        elif tag == 'integer':
+            result = int(data, 16) if data.lower().startswith('0x') else int(data)
+        elif tag == 'real':
+            result = float(data)
+        elif tag in ['true', 'false']:
+            result = tag == 'true'
+        elif tag == 'date':
+            result = datetime.strptime(data.strip(), '%Y-%m-%dT%H:%M:%SZ')
+        elif tag == 'data':
+            result = b64decode(data)
+        else:
+            raise ValueError('Unsupported property list element {tag}'.format(tag=tag))
+
+        return result
+
+
+class BinaryReader:
+    """Reads the values of selected top level keys of a binary property list, without decoding any other objects."""
+    def __init__(self, fp, keys):
+        self.fp = fp
+        self.keys = set(keys)
+        self._ref_size = 0
+        self._offsets = list()
+        self._objects = dict()  # Objects already decoded, shared objects such as repeated keys are only decoded once
+
+    def parse(self):
+        """Parse the property list, returns a dictionary of the selected keys"""
+        result = dict()
+
+        try:
+            self.fp.seek(-32, 2)
+            offset_size, self._ref_size, count, top, table = struct.unpack('>6xBBQQQ', self.fp.read(32))
+            self.fp.seek(table)
+            self._offsets = self.ints(count, offset_size)
+
+            self.fp.seek(self._offsets[top])
+            token = self.fp.read(1)[0]
+
+            if token & 0xF0 != 0xD0:
+                raise ValueError('Top level of the property list is not a dictionary')
+
+            # Only the keys are decoded to find the values asked for
+            length = self.length(token & 0x0F)
+            key_refs, value_refs = self.ints(length, self._ref_size), self.ints(length, self._ref_size)
+
+            for key_ref, value_ref in zip(key_refs, value_refs):
+                key = self.read(key_ref)
+
+                if key in self.keys:
+                    result[key] = self.read(value_ref)
+        except (OSError, IndexError, OverflowError, ValueError, struct.error) as e:
+            # Same as plistlib, malformed binary property lists are invalid files
+            raise plistlib.InvalidFileException('Invalid binary property list: {error}'.format(error=e))
+
+        return result
+
+    def ints(self, count, size):
+        """Read count big endian unsigned integers of size bytes, returns a list"""
+        data = self.fp.read(count * size)
+
+        if size in BINARY_INT_FORMATS:
+            result = list(struct.unpack('>{count}{format}'.format(count=count, format=BINARY_INT_FORMATS[size]), data))
+        else:
+            result = [int.from_bytes(data[_i:_i + size], 'big') for _i in range(0, count * size, size)]
+
+        return result
+
+    def length(self, info):
+        """Length of an object, which follows as an integer object if it doesn't fit in the marker, returns an int"""
+        result = info
+
+        if info == 0x0F:
+            result = int.from_bytes(self.fp.read(1 << (self.fp.read(1)[0] & 0x0F)), 'big')
+
+        return result
+
+    def read(self, ref):
+        """Decode an object and any objects it contains, returns the value"""
+        if ref in self._objects:
+            return self._objects[ref]
+
+        self.fp.seek(self._offsets[ref])
+        token = self.fp.read(1)[0]
+        kind, info = token & 0xF0, token & 0x0F
+        result = None
+
+        if token in [0x00, 0x0F]:
+            result = None if token == 0x00 else b''
+        elif token in [0x08, 0x09]:
+            result = token == 0x09
+        elif kind == 0x10:
+            result = int.from_bytes(self.fp.read(1 << info), 'big', signed=info >= 3)
+        elif kind == 0x20:
+            result = struct.unpack('>f' if info == 2 else '>d', self.fp.read(1 << info))[0]
+        elif token == 0x33:
+            result = BINARY_EPOCH + timedelta(seconds=struct.unpack('>d', self.fp.read(8))[0])
+        elif kind == 0x40:
+            result = self.fp.read(self.length(info))
+        elif kind == 0x50:
+            result = self.fp.read(self.length(info)).decode('ascii')
+        elif kind == 0x60:
+            result = self.fp.read(self.length(info) * 2).decode('utf-16be')
+        elif kind == 0x80:
+            result = plistlib.UID(int.from_bytes(self.fp.read(info + 1), 'big'))
+        elif kind == 0xA0:
+            refs = self.ints(self.length(info), self._ref_size)
+            result = [self.read(_r) for _r in refs]
+        elif kind == 0xD0:
+            length = self.length(info)
+            key_refs, value_refs = self.ints(length, self._ref_size), self.ints(length, self._ref_size)
+            result = {self.read(_k): self.read(_v) for _k, _v in zip(key_refs, value_refs)}
+        else:
+            raise plistlib.InvalidFileException('Unsupported binary property list object {token:#x}'.format(token=token))
+
+        self._objects[ref] = result
+
+        return result
+
+
+def read(f, keys=None):
+    """Read Property List, only reading the top level keys given if keys are specified"""
     result = None
 
     with open(f, 'rb') as _f:
-        result = plistlib.load(_f)
+        if keys is None:
+            result = plistlib.load(_f)
+        elif _f.read(len(BINARY_HEADER)) == BINARY_HEADER:
+            result = BinaryReader(_f, keys).parse()
+        else:
+            _f.seek(0)
+            result = XMLReader(keys).parse(fp=_f)
 
     return result
 
 
-def read_string(s):
-    """Read Property List from string."""
-    result = plistlib.loads(s)
+def read_string(s, keys=None):
+    """Read Property List from string, only reading the top level keys given if keys are specified"""
+    s = s.encode('utf-8') if isinstance(s, str) else s
+
+    if keys is None:
+        result = plistlib.loads(s)
+    elif s.startswith(BINARY_HEADER):
+        result = BinaryReader(BytesIO(s), keys).parse()
+    else:
+        result = XMLReader(keys).parse(s=s)
 
     return result
 
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+
+from urllib.parse import urljoin, urlparse
+
+from . import curl
+from . import httpclient
+from . import PROBE_CONCURRENCY
+from . import PROBE_HOST_LIMIT
+from . import PROBE_TIMEOUT
+from . import USER_AGENT
+
+LOG = logging.getLogger(__name__)
+
+
+class HostConnections:
+    """Kept alive asyncio connections to a single host, capped by a semaphore."""
+    def __init__(self, scheme, host, port, limit, insecure=False):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.insecure = insecure
+        self.limit = asyncio.Semaphore(limit)
+        self.idle = list()
+
+    async def open(self, fresh=False):
+        """Return a tuple of an idle or new (reader, writer) pair at [0] and if it was reused at [1]"""
+        result = None
+
+        while self.idle and not result and not fresh:
+            reader, writer = self.idle.pop()
+
+            if not writer.is_closing() and not reader.at_eof():
+                result = ((reader, writer), True)
+
+        if not result:
+            tls = httpclient.tls_context(self.insecure) if self.scheme == 'https' else None
+            result = (await asyncio.open_connection(self.host, self.port, ssl=tls), False)
+
+        return result
+
+    def close(self):
+        """Close all idle connections"""
+        for _, writer in self.idle:
+            writer.close()
+
+        self.idle.clear()
+
+
+async def head_request(conns, url):
+    """Send a HEAD request on a host connection, returns a tuple of status and header lines"""
+    path = '{path}?{query}'.format(path=url.path or '/', query=url.query) if url.query else url.path or '/'
+    default_port = 443 if url.scheme == 'https' else 80
+    host = url.hostname if conns.port == default_port else '{host}:{port}'.format(host=url.hostname, port=conns.port)
+    request = ('HEAD {path} HTTP/1.1\r\n'
+               'Host: {host}\r\n'
+               'User-Agent: {agent}\r\n'
+               'Accept-Encoding: identity\r\n\r\n').format(path=path, host=host, agent=USER_AGENT)
+
+    async with conns.limit:
+        for attempt in range(2):
+            (reader, writer), reused = await conns.open(fresh=attempt > 0)
+            keep_alive = False
+
+            try:
+                writer.write(request.encode('latin-1'))
+                await writer.drain()
+                status_line = (await reader.readline()).decode('latin-1').strip()
+                lines = list()
+
+                while status_line:
+                    _l = (await reader.readline()).decode('latin-1').strip()
+
+                    if not _l:
+                        break
+
+                    lines.append(_l)
+
+                # HEAD responses have no body, so the connection can be reused unless the server closes it
+                keep_alive = status_line.startswith('HTTP/1.1') and not any([_l.lower() == 'connection: close' for _l in lines])
+            except ConnectionError:
+                if not reused:
+                    raise
+
+                status_line = None
+            finally:
+                if keep_alive:
+                    conns.idle.append((reader, writer))
+                else:
+                    writer.close()
+
+            # A kept alive connection may have been closed by the server, retry once on a new one
+            if status_line or not reused:
+                break
+
+    status = status_line.split(' ')[1] if status_line and len(status_line.split(' ')) > 1 else '0'
+    result = (status, lines)
+
+    return result
+
+
+async def head(u, hosts, insecure=False):
+    """Probe a URL following redirects, returns a Probe"""
+    result = None
+    url = urlparse(u)
+
+    for _ in range(httpclient.MAX_REDIRECTS + 1):
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        key = (url.scheme, url.hostname, port)
+
+        if key not in hosts:
+            hosts[key] = HostConnections(url.scheme, url.hostname, port, limit=PROBE_HOST_LIMIT, insecure=insecure)
+
+        status, lines = await head_request(hosts[key], url)
+
+        # No response, leave it for the blocking probe
+        if status == '0':
+            break
+
+        headers = curl.parse_headers(lines)
+        location = headers.get('location', None)
+
+        if int(status) in httpclient.REDIRECT_STATUS and location:
+            url = urlparse(urljoin(url.geturl(), str(location)))
+            continue
+
+        result = curl.to_probe(status=status, headers=headers, url=url.geturl())
+        break
+
+    return result
+
+
+async def probe_all(urls, insecure=False):
+    """Probe all URLs concurrently with a deadline per request, returns a dictionary of URL and Probe"""
+    result = dict()
+    hosts = dict()
+    in_flight = asyncio.Semaphore(PROBE_CONCURRENCY)
+
+    async def _probe(u):
+        async with in_flight:
+            try:
+                result[u] = await asyncio.wait_for(head(u, hosts, insecure=insecure), timeout=PROBE_TIMEOUT)
+            except (asyncio.TimeoutError, OSError, ValueError) as e:
+                # Leave failed probes for the blocking probe to retry
+                LOG.debug('Async probe of {url} failed: {error}'.format(url=u, error=repr(e)))
+
+    await asyncio.gather(*[_probe(u) for u in urls])
+
+    for _, conns in hosts.items():
+        conns.close()
+
+    return result
+
+
+def run(urls, insecure=False):
+    """Probe any HTTP/HTTPS URLs not yet probed this run and share the results with 'curl.probe'"""
+    # Proxied URLs are left to 'curl.probe', these connections are made directly
+    urls = sorted({str(u) for u in urls if urlparse(str(u)).scheme in ['http', 'https'] and not curl.cached(u)
+                   and not httpclient.proxy(urlparse(str(u)))})
+    result = dict()
+
+    if urls:
+        LOG.debug('Probing {count} URLs asynchronously'.format(count=len(urls)))
+        result = asyncio.run(probe_all(urls, insecure=insecure))
+
+        for u, probe in result.items():
+            if probe:
+                curl.prime(u, probe)
+
+        LOG.debug('Probed {count} of {total} URLs asynchronously'.format(count=len(result), total=len(urls)))
+
+    return result
@@ -8,9 +8,17 @@ from urllib.parse import urlparse
 
 from . import curl
 from . import compare
+from . import delta
 from . import disk
 from . import dmg
+from . import index
+from . import journal
+from . import manifest
+from . import metadata
+from . import scheduler
+from . import server
 from . import source
+from . import sync
 from . import ARGS
 from . import DMG_DEFAULT_FS
 from . import DMG_MOUNT
@@ -76,14 +84,20 @@ def apps_plists():
             else:
                 LOG.info('No application installed for {app}, skipping'.format(app=application))
 
-    # Process any plists
+    # Process any plists, these are fetched concurrently and patched in the order of 'ARGS.plists'
     if ARGS.plists:
-        for plist in ARGS.plists:
-            p = source.PropertyList(plist=plist)
-
+        for p in source.property_lists(ARGS.plists):
             if p and p.packages:
                 _packages.update(p.packages)
 
+    # Process the packages that are new or changed between two plists
+    if ARGS.delta:
+        _delta = delta.diff(*ARGS.delta)
+        _packages.update(_delta.packages)
+
+        if not ARGS.dry_run:
+            delta.write(_delta)
+
     # If deploying packages, only return those that are being upgraded/installed (or forced install)
     if _packages:
         if ARGS.deployment:
@@ -96,6 +110,10 @@ def apps_plists():
     _sequenced_packages = sorted([pkg for pkg in packages if pkg.sequence_number], key=lambda pkg: pkg.sequence_number)
     packages = _unsequenced_packages + _sequenced_packages
 
+    # Persist any package metadata probed while creating packages, and any feeds indexed
+    metadata.save()
+    index.save()
+
     result = (garageband, logicpro, mainstage, packages)
 
     return result
@@ -160,8 +178,27 @@ def freespace_checks(packages):
     return result
 
 
-def download_install(packages):
-    """Downloads or installs packages depending on arguments"""
+def fetch(pkg, quiet=ARGS.silent, replace=False):
+    """Downloads a package, returns the file path object if the download exists"""
+    # Don't unlink files on a deployment server/cache server
+    if ARGS.force and not ARGS.deployment and not (ARGS.pkg_server or ARGS.cache_server):
+        journal.JOURNAL.discard(pkg.download_dest)
+
+    # A package that has changed since it was downloaded is downloaded again from the start
+    if replace:
+        journal.JOURNAL.discard(pkg.download_dest)
+
+    result = curl.get(u=pkg.url, dest=pkg.download_dest, quiet=quiet, resume=pkg.download_resume, http2=ARGS.http2, insecure=ARGS.insecure)
+
+    # The hash computed while downloading is recorded in the manifest of the mirror being downloaded to
+    if result and not ARGS.deployment:
+        manifest.record(pkg)
+
+    return result
+
+
+def install_packages(packages, scheduled, staging=None, plan=None):
+    """Iterates packages in order, downloading (or collecting scheduled downloads) and installing, returns failed count"""
     # Number of packages and incrementing counter
     total_pkgs, counter = (len(packages), 1)
     failed = 0
@@ -174,12 +211,28 @@ def download_install(packages):
         urlscheme = urlparse(pkg.url).scheme
 
         # Update the deployment message prefix for upgrade/force install scenarios
-        if pkg.upgrade:
+        if ARGS.deployment and pkg.upgrade:
             deployment_msg_prefix = 'Upgrade' if ARGS.dry_run else 'Upgrading'
 
         if ARGS.force:
             deployment_msg_prefix = 'Reinstall' if ARGS.dry_run else 'Reinstalling'
 
+        # Unchanged packages aren't downloaded when syncing, unavailable packages keep the existing download
+        if plan and plan.get(pkg) in [sync.UNCHANGED, sync.UNAVAILABLE]:
+            skipped = plan[pkg] == sync.UNCHANGED
+            skip_msg = '{prefix} {count} of {total} - {pkgname} ({reason})'.format(prefix='Skipped' if skipped else 'Failed',
+                                                                                 count=padded_counter,
+                                                                                 total=total_pkgs,
+                                                                                 pkgname=pkg.download_name,
+                                                                                 reason=plan[pkg])
+            sync.REPORT.add('skipped' if skipped else 'failed', pkg.download_size)
+
+            if not ARGS.summary_only:
+                LOG.info(skip_msg)
+
+            counter += 1
+            continue
+
         # Only log downloads if there is a URL scheme
         if urlscheme:
             download_msg = '{dld_prefix} {count} of {total} - {pkgname} ({size})'.format(dld_prefix=download_msg_prefix,
@@ -195,15 +248,16 @@ def download_install(packages):
 
         # Do the download
         if not ARGS.dry_run:
-            # Don't unlink files on a deployment server/cache server
-            if ARGS.force and not ARGS.deployment and not (ARGS.pkg_server or ARGS.cache_server):
-                pkg.download_dest.unlink(missing_ok=True)
-
             # Don't download off a mounted DMG image
             if ARGS.pkg_server and PKG_SERVER_IS_DMG:
                 f = pkg.download_dest
             if urlscheme:
-                f = curl.get(u=pkg.url, dest=pkg.download_dest, quiet=ARGS.silent, resume=pkg.download_resume, http2=ARGS.http2, insecure=ARGS.insecure)
+                f = scheduled[pkg].result() if pkg in scheduled else fetch(pkg, replace=bool(plan) and plan.get(pkg) == sync.CHANGED)
+
+                if plan:
+                    sync.REPORT.add('downloaded' if f else 'failed', pkg.download_size)
+        elif plan and urlscheme:
+            sync.REPORT.add('downloaded', pkg.download_size)
 
         # Do the deployment
         if ARGS.deployment:
@@ -214,7 +268,14 @@ def download_install(packages):
 
             # If not dry run, safe to to do the install, else just log info
             if not ARGS.dry_run:
-                if f.exists():
+                # Packages downloaded from a mirror are verified against the hash in the mirror manifest
+                if f and f.exists() and urlscheme and not manifest.verify(pkg):
+                    LOG.info('{pkgname} does not match the hash in the mirror manifest, skipping install'.format(pkgname=pkg.download_name))
+                    journal.JOURNAL.discard(pkg.download_dest)
+                    failed += 1
+                    f = None
+
+                if f and f.exists():
                     if not ARGS.summary_only:
                         LOG.info(msg)
                     elif ARGS.summary_only:
@@ -243,8 +304,55 @@ def download_install(packages):
                 elif ARGS.summary_only:
                     LOG.warning(msg)
 
+        # Let the next staged download start now this package is done with
+        if staging and pkg in scheduled:
+            staging.release(pkg.download_size)
+
         counter += 1
 
+    return failed
+
+
+def download_install(packages):
+    """Downloads or installs packages depending on arguments"""
+    with scheduler.DownloadScheduler(jobs=ARGS.jobs) as downloads:
+        staging = None
+        scheduled = dict()
+        remote = [pkg for pkg in packages if urlparse(pkg.url).scheme]
+
+        # Load the mirror manifest before any downloads so they are hashed with the algorithm the mirror uses
+        if remote and not ARGS.dry_run:
+            manifest.mirror()
+
+        # Only packages that are new or changed are fetched, either between two plists when downloading a
+        # delta, or since they were downloaded when syncing
+        if ARGS.delta:
+            plan = delta.diff(*ARGS.delta).plan
+        elif ARGS.sync:
+            plan = sync.plan(remote)
+        else:
+            plan = dict()
+
+        remote = [pkg for pkg in remote if plan.get(pkg, sync.NEW) in sync.DOWNLOAD]
+
+        # Schedule downloads ahead when downloading in parallel, progress bars are silenced so output
+        # doesn't interleave, and messages are still logged in package order as each one is collected.
+        if ARGS.jobs > 1 and not ARGS.deployment and not ARGS.dry_run:
+            scheduled = {pkg: downloads.submit(pkg.url, fetch, pkg, quiet=True, replace=plan.get(pkg) == sync.CHANGED) for pkg in remote}
+
+        # When deploying, downloads run ahead of the installs, staging at most the budget on disk
+        if ARGS.deployment and not ARGS.dry_run and remote:
+            staging = scheduler.StagingBudget(budget=ARGS.stage_budget * 1024 * 1024)
+            scheduled = scheduler.stage(downloads, remote, fetch, staging)
+
+        failed = install_packages(packages, scheduled, staging, plan)
+
+    # Write the mirror manifest before a DMG being built is converted
+    manifest.save()
+
+    if plan:
+        LOG.info(sync.REPORT.summary(prefix='Delta' if ARGS.delta else 'Sync', dry_run=ARGS.dry_run))
+
     # Send error message about failed installs and delete error log if no failed installs
     if not ARGS.dry_run:
         fail_log = Path('/var/log/{log}'.format(log=FAIL_LOG))
@@ -264,6 +372,12 @@ def compare_sources():
     compare.sources(ARGS.compare[0], ARGS.compare[1])
 
 
+def serve_mirror():
+    """Serves a mirror over HTTP until interrupted."""
+    server.serve(root=ARGS.serve, port=ARGS.serve_port)
+    sys.exit(0)
+
+
 def convert_sparse(s, f=ARGS.build_dmg):
     """Convert the sparseimage into a DMG"""
     if ARGS.build_dmg:
@@ -279,6 +393,10 @@ def convert_sparse(s, f=ARGS.build_dmg):
 
 def cleanup():
     """Cleans up temporary working directory"""
+    # Record finished and partial downloads, including those interrupted by a keyboard interrupt
+    journal.save()
+    manifest.save()
+
     if TEMPDIR.exists():
         shutil.rmtree(str(TEMPDIR), ignore_errors=True)
 
@@ -0,0 +1,102 @@
+import logging
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Condition, Thread
+from urllib.parse import urlparse
+
+from . import httpclient
+
+LOG = logging.getLogger(__name__)
+
+
+class DownloadScheduler:
+    """Runs downloads on a bounded pool of workers, capping the connections to each host."""
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='download')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # Exiting because of an exception (such as a keyboard interrupt) cancels queued downloads and stops those in
+        # progress, which still finish journaling what they received before the journal is saved
+        if exc[0] is not None:
+            httpclient.STOP.set()
+
+        self.executor.shutdown(wait=True, cancel_futures=exc[0] is not None)
+
+    def host(self, u):
+        """Semaphore capping the connections to the host of a URL, shared with the byte ranges of segmented downloads"""
+        result = httpclient.POOL.slots(urlparse(str(u)))
+
+        return result
+
+    def submit(self, u, fn, *args, **kwargs):
+        """Schedule fn to download u once a worker and a connection to the host are free, returns a Future"""
+        def _run():
+            with self.host(u):
+                return fn(*args, **kwargs)
+
+        result = self.executor.submit(_run)
+        LOG.debug('Scheduled download of {url}'.format(url=u))
+
+        return result
+
+
+class StagingBudget:
+    """Limits the bytes of downloaded packages staged on disk waiting to be installed."""
+    def __init__(self, budget):
+        self.budget = budget
+        self.staged = 0
+        self._cond = Condition()
+
+    def acquire(self, size):
+        """Wait until size bytes fit in the budget, a package larger than the budget waits for an empty stage"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.staged == 0 or self.staged + size <= self.budget)
+            self.staged += size
+
+    def release(self, size):
+        """Release size bytes once a staged package has been installed"""
+        with self._cond:
+            self.staged -= size
+            self._cond.notify_all()
+
+
+def chain(outer, inner):
+    """Copy the outcome of the inner future to the outer future"""
+    if inner.cancelled():
+        outer.cancel()
+    elif inner.exception():
+        outer.set_exception(inner.exception())
+    else:
+        outer.set_result(inner.result())
+
+
+def stage(downloads, packages, fn, budget):
+    """Schedule downloads in package order ahead of installs within a staging budget, returns a dictionary of package and Future"""
+    # Budget is acquired in package order and released in package order by the installs, so an
+    # install never waits on a download that is waiting on budget held by a later package.
+    result = {pkg: Future() for pkg in packages}
+
+    def _feed():
+        fed = 0
+
+        try:
+            for pkg in packages:
+                budget.acquire(pkg.download_size)
+                inner = downloads.submit(pkg.url, fn, pkg, quiet=True)
+                inner.add_done_callback(partial(chain, result[pkg]))
+                fed += 1
+        except Exception as e:
+            # Installs waiting on packages that were never scheduled would otherwise wait forever
+            LOG.debug('Staging downloads failed: {error}'.format(error=e))
+
+            for pkg in list(packages)[fed:]:
+                result[pkg].set_exception(e)
+
+    Thread(target=_feed, name='stage', daemon=True).start()
+
+    return result
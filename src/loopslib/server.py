@@ -0,0 +1,177 @@
+import email.utils
+import logging
+import os
+import re
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePath
+from threading import Lock
+from urllib.parse import unquote, urlparse
+
+from . import manifest
+from . import ARGS
+from . import HTTP_MIRROR_TEST_PATHS
+from . import MIRROR_MANIFEST
+from . import USER_AGENT
+
+LOG = logging.getLogger(__name__)
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+TIMEOUT = 60  # Seconds an idle kept alive connection is held open
+
+
+class MirrorServer(ThreadingHTTPServer):
+    """Threaded HTTP server for a mirror, holding the mirror root and manifest."""
+    daemon_threads = True
+
+    def __init__(self, address, root):
+        self.root = Path(root).resolve()
+        self.mirror = manifest.MirrorManifest(root=self.root, algorithm=ARGS.hash_algorithm)
+        self._manifest_mtime = None
+        self._lock = Lock()
+        self.reload()
+        super().__init__(address, MirrorRequestHandler)
+
+    def reload(self):
+        """Reload the mirror manifest if it has changed on disk"""
+        f = self.root / MIRROR_MANIFEST
+
+        try:
+            mtime = f.stat().st_mtime
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                self._manifest_mtime = mtime
+                self.mirror = manifest.MirrorManifest(root=self.root, algorithm=ARGS.hash_algorithm)
+
+                if mtime:
+                    self.mirror.load(f)
+
+            result = self.mirror
+
+        return result
+
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    """Serves files from a mirror with keep-alive, byte ranges and zero copy responses."""
+    protocol_version = 'HTTP/1.1'
+    server_version = USER_AGENT
+    timeout = TIMEOUT
+
+    def log_message(self, format, *args):
+        LOG.debug('{client} - {msg}'.format(client=self.address_string(), msg=format % args))
+
+    def do_GET(self):
+        self.send_resource(head=False)
+
+    def do_HEAD(self):
+        self.send_resource(head=True)
+
+    def resolve(self):
+        """Resolve the request path to a path in the mirror, returns a tuple of the path and the path relative to the root"""
+        result = (None, None)
+        relpath = unquote(urlparse(self.path).path).lstrip('/')
+        root = self.server.root
+        f = (root / relpath).resolve()
+
+        # Requests outside the mirror root are refused
+        if f != root and root not in f.parents:
+            return result
+
+        # Flat mirrors have every package in the root, but clients request the Apple folder layout
+        if not f.exists() and relpath.endswith('.pkg') and (root / PurePath(relpath).name).is_file():
+            f = root / PurePath(relpath).name
+
+        result = (f, relpath)
+
+        return result
+
+    def send_resource(self, head=False):
+        """Send the headers, and the body unless it's a HEAD request, of a file in the mirror"""
+        f, relpath = self.resolve()
+
+        # Directories are not listed, the mirror test paths must be found even in a flat mirror
+        if f is None:
+            self.send_error(404)
+            return
+        elif f.is_dir() or relpath.rstrip('/') in HTTP_MIRROR_TEST_PATHS:
+            self.send_error(403)
+            return
+        elif not f.is_file():
+            self.send_error(404)
+            return
+
+        # Packages carry the hash from the manifest as long as the file still matches its entry, HEAD and GET alike, so
+        # a HEAD never promises a length or validator the GET won't send
+        entry = self.server.reload().get(relpath) if relpath.endswith('.pkg') else None
+
+        with open(f, 'rb') as _f:
+            stat = os.fstat(_f.fileno())
+            size = stat.st_size
+            entry = entry if entry and entry['size'] == size else None
+            start, end = self.byte_range(size)
+
+            if start is None:
+                self.send_response(200)
+                self.send_headers(length=size, mtime=stat.st_mtime, entry=entry)
+                start, end = 0, size - 1
+            elif start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{size}'.format(size=size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            else:
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {start}-{end}/{size}'.format(start=start, end=end, size=size))
+                self.send_headers(length=end - start + 1, mtime=stat.st_mtime, entry=entry)
+
+            self.end_headers()
+
+            if not head and size:
+                self.wfile.flush()
+                self.connection.sendfile(_f, offset=start, count=end - start + 1)
+
+    def send_headers(self, length, mtime, entry=None):
+        """Send the entity headers of a file"""
+        self.send_header('Content-Type', 'application/json' if self.path.endswith('.json') else 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+
+        if mtime:
+            self.send_header('Last-Modified', email.utils.formatdate(mtime, usegmt=True))
+
+        # The content hash from the manifest is a strong validator
+        if entry and entry.get('hash'):
+            self.send_header('ETag', '"{digest}"'.format(digest=entry['hash']['digest']))
+
+    def byte_range(self, size):
+        """Parse a single byte range request, returns a tuple of inclusive start and end, or (None, None) for the whole file"""
+        result = (None, None)
+        match = RANGE_RE.match(self.headers.get('Range', '').strip())
+
+        # Multiple ranges and malformed ranges are answered with the whole file
+        if not match or not any(match.groups()):
+            return result
+
+        first, last = match.groups()
+
+        if not first:
+            # Suffix range of the last bytes
+            result = (max(size - int(last), 0), size - 1)
+        else:
+            result = (int(first), min(int(last), size - 1) if last else size - 1)
+
+        return result
+
+
+def serve(root, port, address=''):
+    """Serve a mirror until interrupted"""
+    with MirrorServer((address, port), root) as httpd:
+        LOG.info('Serving {root} at http://{host}:{port}/ (press Ctrl-C to stop)'.format(root=httpd.root, host=address or '0.0.0.0', port=port))
+
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            LOG.info('\nStopped serving {root}'.format(root=httpd.root))
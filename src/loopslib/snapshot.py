@@ -0,0 +1,63 @@
+import gzip
+import logging
+import plistlib
+import importlib.resources as resources
+
+from copy import deepcopy
+from functools import lru_cache
+
+from . import curl
+from . import ARGS
+from . import SNAPSHOT_FILE
+
+LOG = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def load():
+    """The feed and package metadata snapshot bundled at build time, returns a dictionary, empty if there isn't one"""
+    result = dict()
+
+    try:
+        result = plistlib.loads(gzip.decompress(resources.read_binary('loopslib.resources', SNAPSHOT_FILE)))
+        LOG.debug('Loaded snapshot of {feeds} feeds and {probes} packages created {created}'.format(feeds=len(result.get('feeds', dict())),
+                                                                                                     probes=len(result.get('probes', dict())),
+                                                                                                     created=result.get('created', None)))
+    except (OSError, ValueError, EOFError) as e:
+        LOG.debug('No snapshot loaded: {error}'.format(error=e))
+
+    return result
+
+
+def offline():
+    """Dry runs and comparisons don't download anything, so they are answered from the snapshot where possible"""
+    result = bool(ARGS.dry_run or ARGS.compare)
+
+    return result
+
+
+def packages(plist):
+    """Raw 'Packages' dictionary of a feed URL from the snapshot, returns a dictionary or None"""
+    result = None
+
+    if offline():
+        result = load().get('feeds', dict()).get(str(plist), None)
+
+        # Callers filter and patch the packages, the snapshot is left untouched
+        if result:
+            result = deepcopy(result)
+
+    return result
+
+
+def probe(u):
+    """Probe of a package URL from the snapshot, returns a Probe or None"""
+    result = None
+
+    if offline():
+        entry = load().get('probes', dict()).get(str(u), None)
+
+        if entry:
+            result = curl.to_probe(status=entry['status'], headers=entry['headers'], url=entry['url'])
+
+    return result
@@ -2,19 +2,19 @@ import logging
 import re
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePath
 from urllib.parse import urlparse
 
 from . import badwolf
-from . import curl
+from . import feeds
 from . import osinfo
 from . import plist
+from . import snapshot
 from . import APPLICATIONS
 from . import APPLICATION_FOLDER
 from . import ARGS
 from . import FEED_URL
-from . import HTTP_OK
-from . import TEMPDIR
 
 LOG = logging.getLogger(__name__)
 
@@ -45,7 +45,7 @@ class Application:
                        if re.search(reg, str(_f))], reverse=True)[0]
 
         if dest.exists():
-            result = plist.read(dest).get('Packages', None)
+            result = plist.read(dest, keys=['Packages']).get('Packages', None)
 
         # Patch and create instances of packages
         if result:
@@ -87,42 +87,34 @@ class PropertyList:
     # appears to be 'MAZP\x00\n\x01] '. When saving this as a 'gzip', the inbuilt
     # macOS Archive Utility decompresses it to a 'cgzp' file, which unzips to the
     # original file. I'm yet to work out what this is (a byte map/array?)
-    def __init__(self, plist, comparing=False):
+    def __init__(self, plist, comparing=False, parse=True):
         self.comparing = comparing  # Used for badwolf - process ALL packages
         self.plist = '{feedurl}/{plist}'.format(feedurl=FEED_URL, plist=plist)
-        self.packages = self.parse_plist()
+        self.packages = self.parse_plist() if parse else None
 
-    def parse_plist(self):
-        """Parses the plist."""
-        result = None
+    def load(self):
+        """Loads the plist, returns the raw 'Packages' dictionary without patching or creating instances."""
+        result = snapshot.packages(self.plist)
         url = urlparse(self.plist)
 
-        # If the file is a URL, it needs to be fetched first
-        if url.scheme and url.scheme in ['http', 'https']:
-            dest = Path('{tmp}/{fp}'.format(tmp=str(TEMPDIR), fp=url.path.lstrip('/')))
-
-            if curl.status(self.plist) in HTTP_OK:
-                # NOTE: Always get this property list silently even in a dry run.
-                f = curl.get(u=self.plist, dest=str(dest), quiet=True, http2=ARGS.http2, insecure=ARGS.insecure, dry_run=False)
-
-                if f and dest.exists():
-                    LOG.debug('Fetched {plist}'.format(plist=self.plist))
-                    result = plist.read(f).get('Packages', None)
-
-                    # Clean up
-                    LOG.debug('Tidying up {plist}'.format(plist=dest))
-                    dest.unlink(missing_ok=True)
-
-                    if not dest.exists():
-                        LOG.debug('Tidied up {plist}'.format(plist=dest))
-                elif not dest.exists():
-                    LOG.info('{plist} not found'.format(plist=dest))
+        # Dry runs and comparisons use the snapshot bundled at build time, otherwise a URL needs to be fetched first
+        if result:
+            LOG.debug('Loaded {plist} from snapshot'.format(plist=self.plist))
+        elif url.scheme and url.scheme in ['http', 'https']:
+            # Feeds are cached and only fetched again if they have changed, specific packages are looked up in the package index first
+            result = feeds.packages(self.plist, names=ARGS.packages)
         elif not url.scheme or isinstance(plist, (Path)):
             if not isinstance(self.plist, Path):
                 self.plist = Path(self.plist)
 
             if self.plist.exists():
-                result = plist.read(self.plist).get('Packages', None)
+                result = plist.read(self.plist, keys=['Packages']).get('Packages', None)
+
+        return result
+
+    def parse_plist(self, packages=None):
+        """Parses the plist, or a subset of its raw 'Packages' dictionary."""
+        result = packages if packages is not None else self.load()
 
         # Patch and create instances of packages
         if result:
@@ -138,3 +130,17 @@ class PropertyList:
             result = badwolf.patch(packages=result, source=self.plist, comparing=self.comparing)
 
         return result
+
+
+def property_lists(plists, comparing=False):
+    """PropertyList instances of plists, fetched and read concurrently then patched in the order given, returns a list"""
+    result = [PropertyList(plist=_p, comparing=comparing, parse=False) for _p in plists]
+
+    with ThreadPoolExecutor(max_workers=max(len(result), 1), thread_name_prefix='feed') as executor:
+        loaded = list(executor.map(lambda _p: _p.load(), result))
+
+    # Patching creates the package instances, so it's done in order for the 'LoopPackage.INSTANCES' dedupe to be deterministic
+    for p, packages in zip(result, loaded):
+        p.packages = p.parse_plist(packages=packages) if packages else None
+
+    return result
@@ -14,8 +14,8 @@ def generate(packages):
     optional_count = len([pkg for pkg in packages if not pkg.mandatory and not pkg.installed]) if ARGS.deployment else len([pkg for pkg in packages if not pkg.mandatory])
     mandatory_dld_size = sum([pkg.download_size for pkg in packages if pkg.mandatory])
     optional_dld_size = sum([pkg.download_size for pkg in packages if not pkg.mandatory])
-    mandatory_inst_size = sum([pkg.installed_size for pkg in packages if pkg.mandatory and not pkg.installed])
-    optional_inst_size = sum([pkg.installed_size for pkg in packages if not pkg.mandatory and not pkg.installed])
+    mandatory_inst_size = sum([pkg.installed_size for pkg in packages if pkg.mandatory and not pkg.installed]) if ARGS.deployment else 0
+    optional_inst_size = sum([pkg.installed_size for pkg in packages if not pkg.mandatory and not pkg.installed]) if ARGS.deployment else 0
 
     # Message strings
     count_msg = list()  # Join with ' and '.join()
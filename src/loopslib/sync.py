@@ -0,0 +1,93 @@
+import logging
+
+from threading import Lock
+
+from . import disk
+from . import journal
+from . import manifest
+from . import metadata
+from . import ARGS
+
+LOG = logging.getLogger(__name__)
+NEW = 'new'
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+UNAVAILABLE = 'unavailable'
+DOWNLOAD = [NEW, CHANGED]
+
+
+class Report:
+    """Counts and bytes of packages downloaded, skipped and failed while syncing."""
+    def __init__(self):
+        self.counts = {'downloaded': [0, 0], 'skipped': [0, 0], 'failed': [0, 0]}
+        self._lock = Lock()
+
+    def add(self, outcome, size):
+        """Add a package outcome of 'downloaded', 'skipped' or 'failed'"""
+        with self._lock:
+            self.counts[outcome][0] += 1
+            self.counts[outcome][1] += size
+
+    def summary(self, prefix='Sync', dry_run=False):
+        """Summary of the sync, returns a string"""
+        _prefix = '{prefix} (dry run)'.format(prefix=prefix) if dry_run else prefix
+        _counts = {_k: '{count} {outcome} ({size})'.format(count=_v[0], outcome=_k, size=disk.convert(_v[1]))
+                   for _k, _v in self.counts.items()}
+        result = '{prefix}: {downloaded}, {skipped}, {failed}'.format(prefix=_prefix, **_counts)
+
+        return result
+
+
+REPORT = Report()
+
+
+def compare(pkg):
+    """Compare a package download against the remote resource, returns NEW, CHANGED, UNCHANGED or UNAVAILABLE"""
+    result = UNCHANGED
+    dest = pkg.download_dest
+
+    # Partial downloads are new, so they resume rather than start again
+    if not dest.exists():
+        return NEW
+
+    # Syncing never trusts cached metadata, the probe is revalidated against the server
+    remote = metadata.probe(pkg.url)
+    entry = journal.JOURNAL.get(dest)
+    validators = (entry or dict()).get('validators', dict())
+    size = dest.stat().st_size
+    mirrored = manifest.mirror().get(manifest.relpath(pkg))
+
+    if remote.status != 200:
+        result = UNAVAILABLE
+    elif remote.content_length and not remote.content_encoding and size != remote.content_length:
+        result = CHANGED
+    elif any([_v and remote.headers.get(_k) and remote.headers.get(_k) != _v for _k, _v in validators.items()]):
+        result = CHANGED
+    elif mirrored and mirrored['size'] != size:
+        result = CHANGED
+    else:
+        # Downloads without validators are journaled with the current ones so later changes are found
+        if not validators and any([remote.headers.get(_k) for _k in journal.VALIDATORS]):
+            _validators = {_k: _v for _k, _v in remote.headers.items() if _k in journal.VALIDATORS}
+
+            if entry:
+                journal.JOURNAL.update(dest, validators=_validators)
+            else:
+                journal.JOURNAL.finish(dest, pkg.url, remote.content_length, received=size, complete=True, validators=_validators)
+
+        # Downloads missing from the mirror manifest are added, reading them if they weren't hashed when downloaded
+        if not mirrored and not ARGS.dry_run:
+            manifest.record(pkg, read=True)
+
+    LOG.debug('Sync {dest} is {result}'.format(dest=dest, result=result))
+
+    return result
+
+
+def plan(packages):
+    """Compare package downloads against the remote resources, returns a dictionary of package and comparison"""
+    result = {pkg: compare(pkg) for pkg in packages}
+
+    LOG.debug('Sync plan: {counts}'.format(counts={_c: list(result.values()).count(_c) for _c in [NEW, CHANGED, UNCHANGED, UNAVAILABLE]}))
+
+    return result
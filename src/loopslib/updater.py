@@ -1,6 +1,7 @@
 import logging
 import re
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from . import curl
@@ -50,25 +51,32 @@ def check(apps, latest, check_limit=11):
     # Print check message and last check time
     LOG.info(''.join(check_msg))
 
+    checks = list()
+
     for app, source_plist in last_update.items():
         if app in (supported and apps):
             ver = int(source_plist.replace(app, ''))
 
-            # Create a URL to check, make sure it exists, if it does, update the result dict.
-            # This should always return the current 'latest' version if no URL's are found
+            # Create a URL to check for each version ahead of the last known version
             for new_ver in range(ver, ver + check_limit):
                 new_plist = '{app}{ver}'.format(app=app, ver=new_ver)
                 url = '{feedurl}/{plist}.plist'.format(feedurl=FEED_URL, plist=new_plist)
-
-                LOG.debug('Checking {url}'.format(url=url))
-
-                status = curl.status(url)
-
-                if status in HTTP_OK and new_plist != result[app]:
-                    found_updates[app] = new_plist
-                    result[app] = new_plist
-                    result['last_updated'] = datetime.now()  # Include a timestamp for the last with successfull update.
-                    LOG.debug('Found updated source plist at {url}'.format(url=url))
+                checks.append((app, new_plist, url))
+
+    # Check every URL concurrently, 'map' returns the statuses in the order the URLs were created
+    with ThreadPoolExecutor(max_workers=max(len(checks), 1), thread_name_prefix='update') as executor:
+        statuses = list(executor.map(lambda _c: curl.status(_c[2]), checks))
+
+    # Make sure each URL exists, if it does, update the result dict, the newest version found wins.
+    # This should always return the current 'latest' version if no URL's are found
+    for (app, new_plist, url), status in zip(checks, statuses):
+        LOG.debug('Checked {url} ({status})'.format(url=url, status=status))
+
+        if status in HTTP_OK and new_plist != result[app]:
+            found_updates[app] = new_plist
+            result[app] = new_plist
+            result['last_updated'] = datetime.now()  # Include a timestamp for the last with successfull update.
+            LOG.debug('Found updated source plist at {url}'.format(url=url))
 
     # Include a last checked timestamp
     result['last_checked'] = datetime.now()
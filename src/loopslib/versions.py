@@ -1,17 +1,94 @@
-from distutils.version import LooseVersion
+import re
+
+from functools import lru_cache, total_ordering
+
+# Same component split as 'distutils.version.LooseVersion'
+COMPONENT_RE = re.compile(r'(\d+ | [a-z]+ | \.)', re.VERBOSE)
+
+
+@total_ordering
+class Version:
+    """Hashable, tuple backed version with the same ordering as LooseVersion"""
+    __slots__ = ('vstring', 'key')
+
+    def __init__(self, vstring):
+        self.vstring = vstring
+        self.key = parse(vstring)
+
+    def __eq__(self, other):
+        other = coerce(other)
+
+        if other is None:
+            return NotImplemented
+
+        return self.key == other.key
+
+    def __lt__(self, other):
+        other = coerce(other)
+
+        if other is None:
+            return NotImplemented
+
+        return self.key < other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return self.vstring
+
+    def __repr__(self):
+        return "Version ('{vstring}')".format(vstring=self.vstring)
+
+
+def parse(vstring):
+    """Parse a version string into a comparison key, returns a tuple"""
+    # NOTE: LooseVersion compares a list of int/str components and raises a TypeError when an int
+    # and str are compared. The key tags ints with 0 and strs with 1 so those compare as int < str.
+    result = tuple(component(_c) for _c in COMPONENT_RE.split(vstring) if _c and _c != '.')
+
+    return result
+
+
+def component(c):
+    """Tag a version component for comparison, returns a tuple"""
+    try:
+        result = (0, int(c))
+    except ValueError:
+        result = (1, c)
+
+    return result
+
+
+@lru_cache(maxsize=None)
+def intern(vstring):
+    """Return the shared Version instance for a version string"""
+    return Version(vstring)
+
+
+def coerce(other):
+    """Coerce a Version or string to a Version, returns None for anything else"""
+    result = None
+
+    if isinstance(other, Version):
+        result = other
+    elif isinstance(other, str):
+        result = intern(other)
+
+    return result
 
 
 def convert(ver=None):
-    """Convert a string into a LooseVersion object."""
-    # NOTE: Return '0.0.0' if 'ver' is None because LooseVersion can't handle 'None'
-    result = LooseVersion('0.0.0')
+    """Convert a string into a Version object."""
+    # NOTE: Return '0.0.0' if 'ver' is None as there is no version to compare
+    result = intern('0.0.0')
 
-    if not isinstance(ver, LooseVersion):
+    if not isinstance(ver, Version):
         if isinstance(ver, str):
-            result = LooseVersion(ver)
+            result = intern(ver)
         elif isinstance(ver, (float, int)):
-            result = LooseVersion(str(ver))
-    elif isinstance(ver, LooseVersion):
+            result = intern(str(ver))
+    elif isinstance(ver, Version):
         result = ver
 
     return result